@@ -1,8 +1,10 @@
 from flask import Flask
 from flask_cors import CORS
 import os
+import time
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     
     # Enable CORS for all routes
@@ -13,9 +15,48 @@ def create_app():
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_key_for_ruby_shop'),
         DATABASE_NAME=os.environ.get('DATABASE_NAME', 'rubyshop.db'),
         JWT_SECRET=os.environ.get('JWT_SECRET', 'jwt_secret_for_ruby_shop'),
-        JWT_EXPIRATION=int(os.environ.get('JWT_EXPIRATION', 86400))  # 24 hours in seconds
+        JWT_EXPIRATION=int(os.environ.get('JWT_EXPIRATION', 86400)),  # 24 hours in seconds
+        DATABASE_POOL_SIZE=int(os.environ.get('DATABASE_POOL_SIZE', 5)),
+        DATABASE_POOL_TIMEOUT=float(os.environ.get('DATABASE_POOL_TIMEOUT', 30)),
+        # SQLite connection profile; unset values fall back to DEFAULT_PROFILE
+        DATABASE_JOURNAL_MODE=os.environ.get('DATABASE_JOURNAL_MODE'),
+        DATABASE_SYNCHRONOUS=os.environ.get('DATABASE_SYNCHRONOUS'),
+        DATABASE_MMAP_SIZE=os.environ.get('DATABASE_MMAP_SIZE'),
+        DATABASE_CACHE_SIZE=os.environ.get('DATABASE_CACHE_SIZE'),
+        DATABASE_TEMP_STORE=os.environ.get('DATABASE_TEMP_STORE'),
+        DATABASE_BUSY_TIMEOUT=os.environ.get('DATABASE_BUSY_TIMEOUT'),
+        CATALOG_CACHE_SIZE=int(os.environ.get('CATALOG_CACHE_SIZE', 1024)),
+        CATALOG_CACHE_TTL=float(os.environ.get('CATALOG_CACHE_TTL', 300)),  # seconds
+        # Catalog responses carry ETags, so clients can always revalidate cheaply
+        CATALOG_CACHE_CONTROL=os.environ.get('CATALOG_CACHE_CONTROL', 'public, no-cache'),
+        AUTH_CACHE_SIZE=int(os.environ.get('AUTH_CACHE_SIZE', 4096)),
+        AUTH_CACHE_TTL=float(os.environ.get('AUTH_CACHE_TTL', 30)),  # seconds
+        PASSWORD_HASH_ITERATIONS=int(os.environ.get('PASSWORD_HASH_ITERATIONS', 100000)),
+        # Hashing slots (workers + queue) must stay below the request threads per
+        # process (WEB_THREADS under Gunicorn) or a login burst can occupy them all
+        PASSWORD_HASH_WORKERS=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+        PASSWORD_HASH_QUEUE_DEPTH=int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', 0)),
+        PASSWORD_HASH_EXECUTOR=os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread'),
+        # Log statements slower than this many milliseconds (unset disables the log)
+        SLOW_QUERY_MS=os.environ.get('SLOW_QUERY_MS'),
+        SLOW_QUERY_EXPLAIN=os.environ.get('SLOW_QUERY_EXPLAIN', '1').lower() in ('1', 'true', 'yes'),
+        # Response compression; encodings in preference order (br and zstd need the
+        # optional brotli and zstandard packages), bodies under COMPRESSION_MIN_SIZE
+        # bytes are sent as is, and an empty list disables compression
+        COMPRESSION_ENCODINGS=os.environ.get('COMPRESSION_ENCODINGS', 'zstd,br,gzip'),
+        COMPRESSION_MIN_SIZE=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+        COMPRESSION_LEVEL=int(os.environ.get('COMPRESSION_LEVEL', 6)),
+        COMPRESSION_CACHE_SIZE=int(os.environ.get('COMPRESSION_CACHE_SIZE', 256)),
+        # Request and query latency metrics served at /api/metrics
+        METRICS_ENABLED=os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
     )
     
+    # Configure the shared database; its pool is opened and the schema checked
+    # once per process on first use, and connections are returned after each request
+    from .extensions import db, password_hasher
+    db.init_app(app)
+    password_hasher.init_app(app)
+    
     # Register blueprints (routes)
     from .routes import auth_bp, products_bp, orders_bp, wishlist_bp, reviews_bp
     app.register_blueprint(auth_bp)
@@ -24,4 +65,18 @@ def create_app():
     app.register_blueprint(wishlist_bp)
     app.register_blueprint(reviews_bp)
     
+    # Latency metrics (no-op unless METRICS_ENABLED)
+    from . import metrics
+    metrics.init_app(app)
+    
+    # Compress responses for clients that send Accept-Encoding
+    from .compression import compressor
+    compressor.init_app(app)
+    
+    # Register CLI commands (flask --app run db ...)
+    from .commands import db_cli
+    app.cli.add_command(db_cli)
+    
+    # Cold start cost, reported with the database bootstrap time at /api/metrics
+    app.startup_seconds = time.perf_counter() - started
     return app 
\ No newline at end of file
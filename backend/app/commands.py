@@ -0,0 +1,43 @@
+import click
+from flask.cli import AppGroup
+from database import migrations
+from database.models import Review
+from .extensions import db
+
+db_cli = AppGroup('db', help='Database maintenance commands')
+
+def _open_without_migrating():
+    """Reopen the database creating its tables but leaving migrations to the caller"""
+    db.close()
+    db.auto_migrate = False
+
+@db_cli.command('profile')
+def show_profile():
+    """Show the SQLite settings active on a pooled connection"""
+    for name, value in db.active_profile().items():
+        click.echo(f"{name}: {value}")
+
+@db_cli.command('upgrade')
+@click.option('--target', type=int, default=None, help='Stop after this schema version')
+def upgrade(target):
+    """Apply pending schema migrations"""
+    _open_without_migrating()
+    applied = db.migrate(target)
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        click.echo("Database schema is up to date")
+    click.echo(f"Schema version: {db.schema_version()}")
+
+@db_cli.command('version')
+def version():
+    """Show the applied and latest schema versions"""
+    _open_without_migrating()
+    click.echo(f"Schema version: {db.schema_version()} (latest {migrations.LATEST_VERSION})")
+
+@db_cli.command('recompute-ratings')
+@click.option('--product', 'product_id', default=None, help='Only recompute this product')
+def recompute_ratings(product_id):
+    """Rebuild product rating aggregates from the reviews table"""
+    updated = Review(db).recompute_ratings(product_id)
+    click.echo(f"Recomputed ratings for {updated} product(s)")
@@ -0,0 +1,174 @@
+"""Accept-Encoding negotiation for API responses.
+
+JSON, NDJSON and text responses are compressed with the best encoding both
+sides support (zstd, br, gzip by default). brotli and zstd need the optional
+``brotli`` and ``zstandard`` packages and are skipped when those are missing.
+Streamed responses are compressed chunk by chunk as they are sent.
+
+Responses carrying a catalog ETag get an encoding-specific ETag, and their
+compressed bytes are cached under it, so a hot listing is compressed once
+per catalog version instead of on every request.
+"""
+from flask import g, request
+import gzip
+import zlib
+from database.cache import LRUCache
+from database.models import STOCK_TAG
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson')
+
+
+def _gzip_compress(data, level):
+    # mtime=0 keeps the output identical for identical input, as strong ETags require
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def _brotli_compress(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _brotli_stream(chunks, level):
+    compressor = brotli.Compressor(quality=level)
+    for chunk in chunks:
+        yield compressor.process(chunk) + compressor.flush()
+    yield compressor.finish()
+
+
+def _zstd_compress(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstd_stream(chunks, level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    yield compressor.flush()
+
+
+# Content coding -> (compress whole body, compress an iterable of chunks)
+CODECS = {'gzip': (_gzip_compress, _gzip_stream)}
+if brotli is not None:
+    CODECS['br'] = (_brotli_compress, _brotli_stream)
+if zstandard is not None:
+    CODECS['zstd'] = (_zstd_compress, _zstd_stream)
+
+# Valid compression levels per content coding
+LEVEL_RANGES = {'gzip': (1, 9), 'br': (0, 11), 'zstd': (1, 22)}
+
+
+class ResponseCompressor:
+    """Compresses responses in an after_request hook"""
+
+    def __init__(self):
+        self.encodings = []
+        self.min_size = 1024
+        self.level = 6
+        self.levels = {}
+        self.cache = LRUCache(max_entries=0)
+        self._versions = None
+
+    def init_app(self, app):
+        """Read the COMPRESSION_* settings and install the hook"""
+        wanted = [name.strip() for name in app.config.get('COMPRESSION_ENCODINGS', '').split(',')]
+        self.encodings = [name for name in wanted if name in CODECS]
+        self.min_size = app.config.get('COMPRESSION_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESSION_LEVEL', self.level)
+        # One setting serves every codec, so clamp it to each one's range
+        self.levels = {name: min(max(self.level, low), high) for name, (low, high) in LEVEL_RANGES.items()}
+        # Compressed catalog bodies, keyed by their encoding-specific ETag
+        self.cache = LRUCache(
+            max_entries=app.config.get('COMPRESSION_CACHE_SIZE', 256),
+            ttl=app.config.get('CATALOG_CACHE_TTL', 300)
+        )
+        if self.encodings:
+            app.after_request(self.compress_response)
+
+    def negotiate(self):
+        """Content coding to use for this request, or None for identity"""
+        if 'content_coding' not in g:
+            g.content_coding = request.accept_encodings.best_match(self.encodings) if self.encodings else None
+        return g.content_coding
+
+    def encoded_etag(self, etag):
+        """ETag of the compressed representation of a response with this ETag"""
+        coding = self.negotiate()
+        return f"{etag}-{coding}" if coding else etag
+
+    def expire(self, catalog_version, stock_version):
+        """Drop compressed bodies made before the catalog, or the stock they show, changed"""
+        versions = (catalog_version, stock_version)
+        if self._versions is not None and versions != self._versions:
+            if catalog_version != self._versions[0]:
+                self.cache.clear()
+            else:
+                self.cache.invalidate_tag(STOCK_TAG)
+        self._versions = versions
+
+    def cached_body(self, etag):
+        """Previously compressed body for an encoded ETag, as (bytes, coding, mimetype)"""
+        return self.cache.get(etag)
+
+    def compress_response(self, response):
+        if response.mimetype not in COMPRESSIBLE_TYPES and not response.mimetype.startswith('text/'):
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers or 'Content-Range' in response.headers):
+            return response
+        coding = self.negotiate()
+        if coding is None:
+            return response
+
+        compress, stream = CODECS[coding]
+        level = self.levels[coding]
+        streamed = response.is_streamed
+        if streamed:
+            response.response = self._stream(response.response, stream, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(compress(data, level))
+
+        response.headers['Content-Encoding'] = coding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{coding}", weak)
+            if not streamed and not weak:
+                tags = [STOCK_TAG] if g.get('shows_stock') else []
+                self.cache.set(response.get_etag()[0], (response.get_data(), coding, response.mimetype), tags)
+        return response
+
+    def _stream(self, body, stream, level):
+        """Compress a streamed body, closing the original iterable when done"""
+        chunks = (chunk.encode() if isinstance(chunk, str) else chunk for chunk in body)
+        try:
+            for data in stream(chunks, level):
+                if data:
+                    yield data
+        finally:
+            close = getattr(body, 'close', None)
+            if close is not None:
+                close()
+
+
+compressor = ResponseCompressor()
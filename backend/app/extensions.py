@@ -0,0 +1,8 @@
+from database.models import Database
+from database.passwords import PasswordHasher
+
+# Shared database handle used by every blueprint, configured in create_app
+db = Database()
+
+# Password hashing pool shared by the auth routes, configured in create_app
+password_hasher = PasswordHasher()
@@ -0,0 +1,149 @@
+"""Request and query latency metrics in the Prometheus text format.
+
+Metrics are off by default. With METRICS_ENABLED set, every request and every
+statement run through Database.execute_query/execute_many is timed, and the
+results are served at /api/metrics. When disabled no hooks are installed, so
+requests and queries pay nothing beyond a single list check.
+"""
+from flask import Blueprint, Response, current_app, g, request
+import bisect
+import threading
+import time
+from database.profiling import normalize_statement
+from .extensions import db
+
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/api')
+
+# Upper bounds in seconds; SQLite statements are mostly sub-millisecond
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+def escape_label(value):
+    """Escape a label value for the text exposition format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Cumulative latency histogram keyed by label values"""
+
+    def __init__(self, name, description, labelnames, buckets):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # One counter per bucket plus +Inf, then the running sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds', 'Time spent handling HTTP requests.',
+    ('endpoint', 'method', 'status'), REQUEST_BUCKETS
+)
+query_latency = Histogram(
+    'db_query_duration_seconds', 'Time spent executing SQL statements (to the first row).',
+    ('statement',), QUERY_BUCKETS
+)
+
+
+def observe_query(query, params, seconds):
+    """Database query hook recording statement latency"""
+    query_latency.observe((normalize_statement(query),), seconds)
+
+
+def start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def record_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    labels = (request.endpoint or 'unmatched', request.method, str(response.status_code))
+    if response.is_streamed:
+        # The body is produced after this hook, so time it to the last byte
+        response.call_on_close(lambda: request_latency.observe(labels, time.perf_counter() - started))
+    else:
+        request_latency.observe(labels, time.perf_counter() - started)
+    return response
+
+
+def gauge(name, description, samples, kind='gauge'):
+    """Render a metric whose samples are (label text, value) pairs"""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+    return lines
+
+
+def collect_gauges():
+    """Startup times and current connection pool and cache state"""
+    startup = [('{phase="create_app"}', f"{current_app.startup_seconds:.6f}")]
+    if db.bootstrap_seconds is not None:
+        startup.append(('{phase="db_bootstrap"}', f"{db.bootstrap_seconds:.6f}"))
+    lines = gauge('app_startup_seconds', 'Time spent starting this process, by phase.', startup)
+
+    if db.pool is not None:
+        pool = db.pool.stats()
+        lines += gauge('db_pool_connections', 'SQLite connections by state.', [
+            ('{state="open"}', pool['open']),
+            ('{state="idle"}', pool['idle']),
+            ('{state="in_use"}', pool['open'] - pool['idle'])
+        ])
+        lines += gauge('db_pool_size', 'Maximum number of pooled connections.', [('', pool['size'])])
+
+    caches = [('catalog', db.cache.stats()), ('auth', db.auth_cache.stats())]
+    lines += gauge('cache_entries', 'Entries currently held in each cache.',
+                   [(f'{{cache="{name}"}}', stats['entries']) for name, stats in caches])
+    for key, description in [('hits', 'Cache lookups served from memory.'),
+                             ('misses', 'Cache lookups that went to the database.'),
+                             ('evictions', 'Entries evicted to stay within max_entries.')]:
+        lines += gauge(f'cache_{key}_total', description,
+                       [(f'{{cache="{name}"}}', stats[key]) for name, stats in caches], kind='counter')
+    return lines
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    lines = request_latency.render() + query_latency.render() + collect_gauges()
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Install the timing hooks and the /api/metrics endpoint when enabled"""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    db.add_query_hook(observe_query)
+    app.register_blueprint(metrics_bp)
@@ -2,19 +2,78 @@ from flask import Blueprint, request, jsonify, current_app
 import jwt
 from datetime import datetime, timedelta
 import functools
+import hashlib
 import json
-from database.models import Database, User
+import secrets
+import threading
+import time
+from database.models import User
+from database.passwords import HasherBusy
+from ..extensions import db, password_hasher
 import re
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
-# Create a global database connection
-db = Database()
-user_model = User(db)
+user_model = User(db, hasher=password_hasher)
+
+@auth_bp.errorhandler(HasherBusy)
+def hasher_busy(error):
+    # Shed load quickly rather than queueing logins behind a saturated pool
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+class RevocationList:
+    """Hashes of revoked tokens, reloaded from the database once per auth cache TTL"""
+
+    def __init__(self):
+        self._hashes = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def is_revoked(self, token):
+        self._refresh()
+        return bool(self._hashes) and hash_token(token) in self._hashes
+
+    def revoke(self, token, user_id, expires_at):
+        token_hash = hash_token(token)
+        user_model.revoke_token(token_hash, user_id, expires_at)
+        with self._lock:
+            self._hashes.add(token_hash)
+        db.auth_cache.invalidate(('token', token))
+
+    def _refresh(self):
+        ttl = db.auth_cache.ttl
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < ttl:
+            return
+        with self._lock:
+            if self._loaded_at is None or now - self._loaded_at >= ttl:
+                self._hashes = user_model.get_revoked_tokens()
+                self._loaded_at = now
+
+revoked_tokens = RevocationList()
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def decode_token(token):
+    """Decode a JWT, reusing the cached payload for tokens seen recently"""
+    key = ('token', token)
+    payload = db.auth_cache.get(key)
+    
+    if payload is None:
+        payload = jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=['HS256'])
+        db.auth_cache.set(key, payload, tags=[f"user:{payload['user_id']}"])
+    elif payload.get('exp', float('inf')) <= time.time():
+        raise jwt.ExpiredSignatureError('Signature has expired')
+    
+    return payload
 
 def generate_token(user_id):
     payload = {
         'user_id': user_id,
+        'jti': secrets.token_hex(8),  # Unique per login so revoking one token never hits another
         'exp': datetime.utcnow() + timedelta(seconds=current_app.config['JWT_EXPIRATION'])
     }
     return jwt.encode(payload, current_app.config['JWT_SECRET'], algorithm='HS256')
@@ -32,15 +91,21 @@ def token_required(f):
             return jsonify({'message': 'Authentication required'}), 401
             
         try:
-            payload = jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=['HS256'])
+            payload = decode_token(token)
+            
+            if revoked_tokens.is_revoked(token):
+                return jsonify({'message': 'Token has been revoked'}), 401
+            
             user_id = payload['user_id']
             user = user_model.get_by_id(user_id)
             
             if not user:
                 return jsonify({'message': 'Invalid token or user not found'}), 401
                 
-            # Add user to the request context
+            # Add user and token to the request context
             request.user = user
+            request.token = token
+            request.token_payload = payload
             
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token expired'}), 401
@@ -123,6 +188,13 @@ def login():
         }
     }), 200
 
+@auth_bp.route('/logout', methods=['POST'])
+@token_required
+def logout():
+    expires_at = request.token_payload.get('exp', time.time() + current_app.config['JWT_EXPIRATION'])
+    revoked_tokens.revoke(request.token, request.user['id'], expires_at)
+    return jsonify({'message': 'Logged out successfully'}), 200
+
 @auth_bp.route('/profile', methods=['GET'])
 @token_required
 def get_profile():
@@ -0,0 +1,60 @@
+from flask import request, current_app, make_response, g
+import functools
+import hashlib
+from database.models import Product, shows_stock
+from ..extensions import db
+from ..compression import compressor
+from .streaming import ndjson_requested
+
+def catalog_etag(version, stock_version=None):
+    """Strong ETag for the current URL and representation at a given catalog
+    version, and stock version for responses that show stock_left"""
+    url_hash = hashlib.sha1(request.full_path.encode()).hexdigest()[:16]
+    if stock_version is not None:
+        version = f"{version}.{stock_version}"
+    # NDJSON can be negotiated with Accept alone, so it needs an ETag of its own
+    suffix = '-ndjson' if ndjson_requested() else ''
+    return f"c{version}-{url_hash}{suffix}"
+
+def conditional_get(f=None, stock=False):
+    """Serve catalog reads with an ETag and answer If-None-Match with 304.
+
+    The ETag comes from the catalog version counter kept in the database, so
+    a matching request returns before the view queries or renders anything.
+    With stock=True (product views) it also carries the stock version unless
+    fields= leaves stock_left out, so checkouts change it only where stock
+    is shown. Compressed responses have their own ETag (see app.compression),
+    and a body already compressed for it is served without calling the view.
+    """
+    if f is None:
+        return functools.partial(conditional_get, stock=stock)
+    
+    @functools.wraps(f)
+    def decorated(*args, **kwargs):
+        version = db.catalog_version()
+        compressor.expire(version, db.stock_version)
+        g.shows_stock = stock and shows_stock(Product.resolve_fields(request.args.get('fields')))
+        etag = catalog_etag(version, db.stock_version if g.shows_stock else None)
+        encoded_etag = compressor.encoded_etag(etag)
+        cached = compressor.cached_body(encoded_etag) if encoded_etag != etag else None
+        
+        if request.if_none_match.contains(encoded_etag):
+            response = current_app.response_class(status=304)
+            etag = encoded_etag
+        elif request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        elif cached is not None:
+            body, coding, mimetype = cached
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.headers['Content-Encoding'] = coding
+            etag = encoded_etag
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag)
+        response.vary.add('Accept')
+        response.headers['Cache-Control'] = current_app.config['CATALOG_CACHE_CONTROL']
+        return response
+    return decorated
@@ -1,19 +1,62 @@
 from flask import Blueprint, request, jsonify
-from database.models import Database, Order
+from database.models import Order, OutOfStock, page_limit
+from ..extensions import db
 from .auth import token_required
+from .streaming import wants_stream, stream_response
 
 orders_bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 
-# Create a global database connection
-db = Database()
 order_model = Order(db)
 
+# Most orders a single ?ids= request may fetch
+MAX_BATCH_IDS = 100
+
+@orders_bp.errorhandler(ValueError)
+def invalid_order_args(error):
+    return jsonify({'message': str(error)}), 400
+
+@orders_bp.errorhandler(OutOfStock)
+def out_of_stock(error):
+    return jsonify({'message': 'Some items are out of stock', 'items': error.shortages}), 409
+
+def _parse_ids(value):
+    """Parse a comma-separated list of order IDs"""
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of order IDs")
+    if not ids or len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f"ids must list between 1 and {MAX_BATCH_IDS} order IDs")
+    return list(dict.fromkeys(ids))
+
 @orders_bp.route('', methods=['GET'])
 @token_required
 def get_user_orders():
     user_id = request.user['id']
-    orders = order_model.get_user_orders(user_id)
-    return jsonify({'orders': orders, 'count': len(orders)}), 200
+    include_items = 'items' in request.args.get('include', '').split(',')
+    
+    # Batch fetch: ?ids=1,2,3 returns those orders with their items
+    if request.args.get('ids') is not None:
+        order_ids = _parse_ids(request.args['ids'])
+        orders = order_model.get_many(order_ids, user_id)
+        found = {order['id'] for order in orders}
+        return jsonify({
+            'orders': orders,
+            'count': len(orders),
+            'missing': [order_id for order_id in order_ids if order_id not in found]
+        }), 200
+    
+    limit = page_limit(request.args.get('limit', type=int))
+    cursor = request.args.get('cursor')
+    
+    if wants_stream(limit=limit):
+        orders = order_model.stream_user_orders(user_id, include_items=include_items, cursor=cursor)
+        return stream_response('orders', orders, next_cursor=None)
+    
+    orders = order_model.get_user_orders(
+        user_id, limit=limit, cursor=cursor, include_items=include_items
+    )
+    return jsonify({'orders': orders, 'count': len(orders), 'next_cursor': orders.next_cursor}), 200
 
 @orders_bp.route('/<int:order_id>', methods=['GET'])
 @token_required
@@ -31,30 +74,27 @@ def get_order(order_id):
 def create_order():
     data = request.json
     
-    if not data or not data.get('items') or not data.get('total_amount'):
-        return jsonify({'message': 'Items and total amount are required'}), 400
+    if not data or not data.get('items'):
+        return jsonify({'message': 'Items are required'}), 400
         
     user_id = request.user['id']
     items = data.get('items')
-    total_amount = data.get('total_amount')
     shipping_address = data.get('shipping_address')
     payment_method = data.get('payment_method')
     
     if not isinstance(items, list) or len(items) == 0:
         return jsonify({'message': 'Items must be a non-empty array'}), 400
         
-    order_id = order_model.create(
+    # Prices and the total are computed server-side; any client values are ignored
+    order = order_model.create(
         user_id, 
         items, 
-        total_amount, 
         shipping_address, 
         payment_method
     )
     
-    if not order_id:
+    if not order:
         return jsonify({'message': 'Failed to create order'}), 400
-        
-    order = order_model.get_by_id(order_id, user_id)
     
     return jsonify({
         'message': 'Order created successfully',
@@ -1,24 +1,96 @@
 from flask import Blueprint, request, jsonify
-from database.models import Database, Product
+import json
+from database.models import Product, page_limit
+from ..extensions import db
 from .auth import token_required
+from .http_cache import conditional_get
+from .streaming import wants_stream, stream_response
 
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
-# Create a global database connection
-db = Database()
 product_model = Product(db)
 
+def _page_args():
+    """Read the pagination query parameters shared by every listing endpoint"""
+    return {
+        'limit': page_limit(request.args.get('limit', type=int)),
+        'cursor': request.args.get('cursor'),
+        'with_total': request.args.get('total', '').lower() in ('1', 'true', 'yes'),
+        'columns': Product.resolve_fields(request.args.get('fields'))
+    }
+
+def _page_response(products, **extra):
+    """Build a listing response including the cursor for the next page"""
+    body = {
+        'products': products,
+        'count': len(products),
+        'next_cursor': products.next_cursor
+    }
+    if products.total is not None:
+        body['total'] = products.total
+    body.update(extra)
+    return jsonify(body), 200
+
+@products_bp.errorhandler(ValueError)
+def invalid_page_args(error):
+    return jsonify({'message': str(error)}), 400
+
 @products_bp.route('', methods=['GET'])
+@conditional_get(stock=True)
 def get_all_products():
-    limit = request.args.get('limit', type=int)
     offset = request.args.get('offset', type=int)
+    page_args = _page_args()
+    
+    # Unlimited listings are streamed instead of built (and cached) in memory
+    if wants_stream(default=True, limit=page_args['limit']):
+        products = product_model.stream_all(
+            offset=offset, cursor=page_args['cursor'], columns=page_args['columns']
+        )
+        extra = {'total': product_model.count_all()} if page_args['with_total'] else {}
+        return stream_response('products', products, next_cursor=None, **extra)
+    
+    products = product_model.get_all(offset=offset, **page_args)
+    return _page_response(products)
+
+# Most products a single batch lookup may return
+MAX_BATCH_IDS = 500
+
+def _batch_response(product_ids):
+    """Look up many products at once, reporting the ids that were not found"""
+    if not product_ids or len(product_ids) > MAX_BATCH_IDS:
+        return jsonify({'message': f"Between 1 and {MAX_BATCH_IDS} product IDs are required"}), 400
+    
+    product_ids = list(dict.fromkeys(product_ids))
+    columns = Product.resolve_fields(request.args.get('fields'))
+    products = product_model.get_many(product_ids, columns=columns)
+    found = {product['id'] for product in products}
+    return jsonify({
+        'products': products,
+        'count': len(products),
+        'missing': [product_id for product_id in product_ids if product_id not in found]
+    }), 200
+
+@products_bp.route('/batch', methods=['GET'])
+@conditional_get(stock=True)
+def get_products_batch():
+    ids = request.args.get('ids', '')
+    return _batch_response([product_id.strip() for product_id in ids.split(',') if product_id.strip()])
+
+@products_bp.route('/batch', methods=['POST'])
+def post_products_batch():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
     
-    products = product_model.get_all(limit=limit, offset=offset)
-    return jsonify({'products': products, 'count': len(products)}), 200
+    if not isinstance(ids, list) or not all(isinstance(product_id, str) for product_id in ids):
+        return jsonify({'message': 'ids must be an array of product IDs'}), 400
+        
+    return _batch_response(ids)
 
 @products_bp.route('/<product_id>', methods=['GET'])
+@conditional_get(stock=True)
 def get_product(product_id):
-    product = product_model.get_by_id(product_id)
+    columns = Product.resolve_fields(request.args.get('fields'))
+    product = product_model.get_by_id(product_id, columns=columns)
     
     if not product:
         return jsonify({'message': 'Product not found'}), 404
@@ -26,29 +98,37 @@ def get_product(product_id):
     return jsonify({'product': product}), 200
 
 @products_bp.route('/category/<category>', methods=['GET'])
+@conditional_get(stock=True)
 def get_products_by_category(category):
-    limit = request.args.get('limit', type=int)
-    
-    products = product_model.get_by_category(category, limit=limit)
-    return jsonify({'products': products, 'count': len(products)}), 200
+    products = product_model.get_by_category(category, **_page_args())
+    return _page_response(products)
 
 @products_bp.route('/sale', methods=['GET'])
+@conditional_get(stock=True)
 def get_sale_products():
-    limit = request.args.get('limit', type=int)
-    
-    products = product_model.get_on_sale(limit=limit)
-    return jsonify({'products': products, 'count': len(products)}), 200
+    products = product_model.get_on_sale(**_page_args())
+    return _page_response(products)
 
 @products_bp.route('/search', methods=['GET'])
+@conditional_get(stock=True)
 def search_products():
     query = request.args.get('q', '')
-    limit = request.args.get('limit', type=int)
+    tags = request.args.getlist('tag')
     
-    if not query:
+    if not query and not tags:
         return jsonify({'message': 'Search query is required'}), 400
         
-    products = product_model.search(query, limit=limit)
-    return jsonify({'products': products, 'count': len(products), 'query': query}), 200
+    page_args = _page_args()
+    
+    if wants_stream(default=True, limit=page_args['limit']):
+        products = product_model.stream_search(
+            query, tags=tags, cursor=page_args['cursor'], columns=page_args['columns']
+        )
+        extra = {'total': product_model.count_search(query, tags)} if page_args['with_total'] else {}
+        return stream_response('products', products, next_cursor=None, query=query, **extra)
+    
+    products = product_model.search(query, tags=tags, **page_args)
+    return _page_response(products, query=query)
 
 @products_bp.route('', methods=['POST'])
 @token_required
@@ -67,6 +147,35 @@ def create_product():
         'product_id': product_id
     }), 201
 
+def _ndjson_rows(stream):
+    """Parse an NDJSON body line by line without reading it all into memory"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            # Reported as an error for this row by bulk_upsert
+            yield ValueError(f"Invalid JSON: {e}")
+
+@products_bp.route('/bulk', methods=['POST'])
+@token_required
+def bulk_upsert_products():
+    # This endpoint would typically be restricted to admin users
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = _ndjson_rows(request.stream)
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            return jsonify({'message': 'Expected a JSON array or an NDJSON body'}), 400
+    
+    chunk_size = request.args.get('chunk_size', 1000, type=int)
+    summary = product_model.bulk_upsert(rows, chunk_size=max(1, chunk_size))
+    
+    status = 200 if summary['upserted'] or not summary['failed'] else 400
+    return jsonify(summary), status
+
 @products_bp.route('/<product_id>', methods=['PUT'])
 @token_required
 def update_product(product_id):
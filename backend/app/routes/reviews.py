@@ -1,14 +1,15 @@
 from flask import Blueprint, request, jsonify
-from database.models import Database, Review
+from database.models import Review
+from ..extensions import db
 from .auth import token_required
+from .http_cache import conditional_get
 
 reviews_bp = Blueprint('reviews', __name__, url_prefix='/api/reviews')
 
-# Create a global database connection
-db = Database()
 review_model = Review(db)
 
 @reviews_bp.route('/product/<product_id>', methods=['GET'])
+@conditional_get
 def get_product_reviews(product_id):
     reviews = review_model.get_by_product(product_id)
     return jsonify({'reviews': reviews, 'count': len(reviews)}), 200
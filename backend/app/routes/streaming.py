@@ -0,0 +1,73 @@
+from flask import request, current_app, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Rows serialized per chunk written to the client
+CHUNK_ROWS = 200
+
+def ndjson_requested():
+    """Whether the client asked for NDJSON, by ?stream=ndjson or the Accept header"""
+    if request.args.get('stream', '').lower() == 'ndjson':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+def wants_stream(default=False, limit=None):
+    """Whether to stream this response: ?stream=1|ndjson, an NDJSON Accept header,
+    or default (used for unlimited listings) unless ?stream=0.
+
+    Streams carry every row after the cursor and never a next_cursor, so a
+    page (limit) is always served buffered; ?stream with a limit raises ValueError.
+    """
+    value = request.args.get('stream')
+    if value is not None:
+        stream = value.lower() in ('1', 'true', 'yes', 'ndjson')
+    else:
+        stream = default or ndjson_requested()
+    
+    if stream and limit:
+        if value is not None:
+            raise ValueError("stream cannot be combined with limit")
+        return False
+    return stream
+
+def _chunks(rows, dumps, separator):
+    """Serialize rows CHUNK_ROWS at a time; yields (text, rows in text)"""
+    buffer = []
+    for row in rows:
+        buffer.append(dumps(row))
+        if len(buffer) >= CHUNK_ROWS:
+            yield separator.join(buffer), len(buffer)
+            buffer = []
+    if buffer:
+        yield separator.join(buffer), len(buffer)
+
+def stream_response(key, rows, **extra):
+    """Stream rows from a generator without building the whole body in memory.
+
+    JSON responses have the same shape as the buffered ones,
+    {"<key>": [...], "count": n, ...extra}, with count written last. NDJSON
+    responses are one row per line. A total in extra is also sent as the
+    X-Total-Count header, so NDJSON clients get it too. The request context
+    (and with it the pooled connection feeding the rows) stays open until the
+    last row is sent.
+    """
+    dumps = current_app.json.dumps
+    headers = {'X-Total-Count': str(extra['total'])} if extra.get('total') is not None else None
+
+    if ndjson_requested():
+        def generate():
+            for text, _ in _chunks(rows, dumps, '\n'):
+                yield text + '\n'
+        return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE,
+                                          headers=headers)
+
+    def generate():
+        yield '{' + dumps(key) + ': ['
+        count = 0
+        for text, size in _chunks(rows, dumps, ', '):
+            yield (', ' if count else '') + text
+            count += size
+        yield '], ' + dumps(dict(extra, count=count))[1:]
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json',
+                                      headers=headers)
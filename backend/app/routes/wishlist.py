@@ -1,18 +1,22 @@
 from flask import Blueprint, request, jsonify
-from database.models import Database, Wishlist
+from database.models import Product, Wishlist
+from ..extensions import db
 from .auth import token_required
 
 wishlist_bp = Blueprint('wishlist', __name__, url_prefix='/api/wishlist')
 
-# Create a global database connection
-db = Database()
 wishlist_model = Wishlist(db)
 
+@wishlist_bp.errorhandler(ValueError)
+def invalid_fields(error):
+    return jsonify({'message': str(error)}), 400
+
 @wishlist_bp.route('', methods=['GET'])
 @token_required
 def get_wishlist():
     user_id = request.user['id']
-    wishlist_items = wishlist_model.get_user_wishlist(user_id)
+    columns = Product.resolve_fields(request.args.get('fields'))
+    wishlist_items = wishlist_model.get_user_wishlist(user_id, columns=columns)
     return jsonify({'items': wishlist_items, 'count': len(wishlist_items)}), 200
 
 @wishlist_bp.route('', methods=['POST'])
@@ -0,0 +1,422 @@
+"""Endpoint benchmark suite driven by the Flask test client.
+
+Runs every blueprint route against a generated database, either one request
+at a time (micro) or from many threads at once (load), and writes p50/p95/p99
+latency and throughput to a JSON file that can be compared between commits.
+The contention mode releases hundreds of buyers on one product at once and
+checks that its stock is never oversold.
+
+Examples:
+    python benchmark.py --db bench.db --mode both --output results.json
+    python benchmark.py --db bench.db --compare results.json --threshold 15
+    python benchmark.py --db bench.db --mode contention --buyers 500 --stock 100
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SEARCH_TERMS = ['sweater', 'holiday', 'gift', 'lights', 'mug', 'winter jacket', 'cozy', 'tea', 'bear', 'spa']
+
+
+class Scenario:
+    """One benchmarked request; ``build`` returns (method, url, json body, needs auth)"""
+
+    def __init__(self, name, build, weight=1, max_iterations=None):
+        self.name = name
+        self.build = build
+        self.weight = weight
+        self.max_iterations = max_iterations
+
+
+class Fixture:
+    """Sample ids and credentials drawn from the benchmark database"""
+
+    def __init__(self, client, db_path, seed, email, password):
+        conn = sqlite3.connect(db_path)
+        self.product_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM products ORDER BY rowid LIMIT 5000")]
+        self.categories = [row[0] for row in conn.execute("SELECT DISTINCT category FROM products")]
+        # Orders only use products that can still be bought, so they do not fail with 409
+        self.in_stock_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM products WHERE stock_left IS NULL OR stock_left > 0 ORDER BY rowid LIMIT 5000")]
+        conn.close()
+        if not self.product_ids:
+            raise SystemExit("Benchmark database has no products; run database/generate.py first")
+        if not self.in_stock_ids:
+            raise SystemExit("Every benchmark product is out of stock; regenerate the database")
+
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.email = email
+        self.password = password
+
+        response = client.post('/api/auth/login', json={'email': email, 'password': password})
+        if response.status_code != 200:
+            raise SystemExit(f"Could not log in as {email}: {response.status_code} {response.get_json()}")
+        self.token = response.get_json()['token']
+
+        response = client.post('/api/orders', json=self.order_body(), headers=self.auth_headers())
+        if response.status_code != 201:
+            raise SystemExit(f"Could not place the sample order: {response.status_code} {response.get_json()}")
+        self.order_id = response.get_json()['order']['id']
+
+    def auth_headers(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def pick(self, values):
+        with self.rng_lock:
+            return self.rng.choice(values)
+
+    def order_body(self):
+        with self.rng_lock:
+            product_ids = self.rng.sample(self.in_stock_ids, min(3, len(self.in_stock_ids)))
+        items = [{'product_id': pid, 'quantity': 1} for pid in product_ids]
+        return {'items': items, 'payment_method': 'COD'}
+
+
+def build_scenarios(fx):
+    """Every blueprint route, weighted roughly like browse-heavy storefront traffic"""
+    return [
+        Scenario('products.list', lambda: ('GET', '/api/products?limit=24', None, False), weight=10),
+        Scenario('products.detail', lambda: ('GET', f"/api/products/{fx.pick(fx.product_ids)}", None, False), weight=20),
+        Scenario('products.category', lambda: ('GET', f"/api/products/category/{fx.pick(fx.categories)}?limit=24", None, False), weight=10),
+        Scenario('products.sale', lambda: ('GET', '/api/products/sale?limit=24', None, False), weight=5),
+        Scenario('products.search', lambda: ('GET', f"/api/products/search?q={fx.pick(SEARCH_TERMS)}&limit=24", None, False), weight=10),
+        Scenario('auth.login', lambda: ('POST', '/api/auth/login', {'email': fx.email, 'password': fx.password}, False), weight=1, max_iterations=50),
+        Scenario('auth.profile', lambda: ('GET', '/api/auth/profile', None, True), weight=3),
+        Scenario('orders.create', lambda: ('POST', '/api/orders', fx.order_body(), True), weight=2),
+        Scenario('orders.get', lambda: ('GET', f"/api/orders/{fx.order_id}", None, True), weight=3),
+        Scenario('orders.list', lambda: ('GET', '/api/orders', None, True), weight=3),
+        Scenario('wishlist.get', lambda: ('GET', '/api/wishlist', None, True), weight=5),
+        Scenario('wishlist.add', lambda: ('POST', '/api/wishlist', {'product_id': fx.pick(fx.product_ids)}, True), weight=2),
+        Scenario('reviews.get', lambda: ('GET', f"/api/reviews/product/{fx.pick(fx.product_ids)}", None, False), weight=5),
+        Scenario('reviews.create', lambda: ('POST', f"/api/reviews/product/{fx.pick(fx.product_ids)}", {'rating': 4, 'comment': 'Benchmark'}, True), weight=1),
+    ]
+
+
+def send(client, fx, scenario):
+    """Issue one request, returning (latency in seconds, status code)"""
+    method, url, body, needs_auth = scenario.build()
+    headers = fx.auth_headers() if needs_auth else None
+    started = time.perf_counter()
+    response = client.open(url, method=method, json=body, headers=headers)
+    response.get_data()  # Drain streamed bodies so their cost is measured
+    return time.perf_counter() - started, response.status_code
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, statuses, elapsed):
+    """Latency percentiles (milliseconds), throughput and status counts"""
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'requests': len(values),
+        'errors': sum(count for status, count in statuses.items() if int(status) >= 500),
+        'statuses': dict(sorted(statuses.items())),
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]) if values else None,
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed > 0 else None
+    }
+
+
+def run_micro(app, fx, scenarios, iterations, warmup):
+    """Time each scenario sequentially on a single thread"""
+    results = {}
+    client = app.test_client()
+    for scenario in scenarios:
+        count = min(iterations, scenario.max_iterations or iterations)
+        for _ in range(min(warmup, count)):
+            send(client, fx, scenario)
+
+        latencies, statuses = [], {}
+        started = time.perf_counter()
+        for _ in range(count):
+            latency, status = send(client, fx, scenario)
+            latencies.append(latency)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        results[scenario.name] = summarize(latencies, statuses, time.perf_counter() - started)
+        print(format_row(scenario.name, results[scenario.name]))
+    return results
+
+
+def run_load(app, fx, scenarios, threads, duration, seed):
+    """Run a weighted mix of scenarios from many threads for a fixed duration"""
+    latencies = {s.name: [] for s in scenarios}
+    statuses = {s.name: {} for s in scenarios}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    weights = [s.weight for s in scenarios]
+
+    def worker(worker_id):
+        client = app.test_client()
+        rng = random.Random(seed + worker_id)
+        local = []
+        while time.perf_counter() < deadline:
+            scenario = rng.choices(scenarios, weights=weights)[0]
+            latency, status = send(client, fx, scenario)
+            local.append((scenario.name, latency, status))
+        with lock:
+            for name, latency, status in local:
+                latencies[name].append(latency)
+                statuses[name][str(status)] = statuses[name].get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {'endpoints': {}}
+    for scenario in scenarios:
+        if latencies[scenario.name]:
+            results['endpoints'][scenario.name] = summarize(
+                latencies[scenario.name], statuses[scenario.name], elapsed)
+            print(format_row(scenario.name, results['endpoints'][scenario.name]))
+
+    all_statuses = {}
+    for counts in statuses.values():
+        for status, count in counts.items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+    results['overall'] = summarize(
+        [value for values in latencies.values() for value in values], all_statuses, elapsed)
+    print(format_row('overall', results['overall']))
+    return results
+
+
+def run_contention(app, fx, db_path, buyers, stock, quantity):
+    """Release buyers on one product at the same instant and check nothing is oversold"""
+    product_id = fx.product_ids[0]
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("UPDATE products SET stock_left = ? WHERE id = ?", (stock, product_id))
+    conn.commit()
+
+    body = {'items': [{'product_id': product_id, 'quantity': quantity}], 'payment_method': 'COD'}
+    scenario = Scenario('orders.contention', lambda: ('POST', '/api/orders', body, True))
+    barrier = threading.Barrier(buyers)
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def buyer():
+        client = app.test_client()
+        barrier.wait()
+        latency, status = send(client, fx, scenario)
+        with lock:
+            latencies.append(latency)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=buyer) for _ in range(buyers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    remaining = conn.execute("SELECT stock_left FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+    conn.close()
+
+    sold = statuses.get('201', 0) * quantity
+    results = summarize(latencies, statuses, elapsed)
+    results.update({
+        'product_id': product_id,
+        'buyers': buyers,
+        'initial_stock': stock,
+        'sold': sold,
+        'stock_left': remaining,
+        # Every unit must be sold exactly once: no oversell, no lost stock
+        'oversold': sold > stock or remaining != stock - sold,
+        'sold_out': stock - sold < quantity
+    })
+    print(format_row(scenario.name, results))
+    print(f"  sold {sold} of {stock} units to {buyers} buyers, {remaining} left"
+          f"{' - OVERSOLD' if results['oversold'] else ''}")
+    return results
+
+
+def format_row(name, stats):
+    return (f"  {name:<20} n={stats['requests']:<7} p50={stats['p50_ms']:>9.3f}ms "
+            f"p95={stats['p95_ms']:>9.3f}ms p99={stats['p99_ms']:>9.3f}ms "
+            f"{stats['throughput_rps']:>9.1f} req/s  errors={stats['errors']}")
+
+
+def compare(current, baseline_path, threshold):
+    """Report endpoints whose p50 or p95 got more than threshold percent slower"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    pairs = []
+    if 'micro' in current and 'micro' in baseline:
+        pairs += [('micro', name, stats, baseline['micro'].get(name))
+                  for name, stats in current['micro'].items()]
+    if 'load' in current and 'load' in baseline:
+        pairs += [('load', name, stats, baseline['load']['endpoints'].get(name))
+                  for name, stats in current['load']['endpoints'].items()]
+
+    for mode, name, stats, before in pairs:
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            old, new = before.get(metric), stats.get(metric)
+            if old and new and (new - old) / old * 100 > threshold:
+                regressions.append(f"{mode} {name} {metric}: {old:.3f}ms -> {new:.3f}ms "
+                                   f"(+{(new - old) / old * 100:.0f}%)")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Ruby's eShop API")
+    parser.add_argument('--db', default='bench.db', help='Database file (relative to backend/)')
+    parser.add_argument('--generate', action='store_true',
+                        help='Generate a small database first if --db does not exist')
+    parser.add_argument('--mode', choices=['micro', 'load', 'both', 'contention'], default='both')
+    parser.add_argument('--iterations', type=int, default=500, help='Requests per endpoint in micro mode')
+    parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per endpoint first')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent clients in load mode')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds to run load mode')
+    parser.add_argument('--buyers', type=int, default=300, help='Concurrent buyers in contention mode')
+    parser.add_argument('--stock', type=int, default=100, help='Units on sale in contention mode')
+    parser.add_argument('--quantity', type=int, default=1, help='Units each buyer orders in contention mode')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Run against --db itself instead of a throwaway copy (writes accumulate)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--email', default='user1@example.com', help='Benchmark login (from generate.py)')
+    parser.add_argument('--password', default='test123')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help='Earlier result file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Allowed slowdown in percent')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    db_path = os.path.join(BACKEND_DIR, args.db)
+    if not os.path.exists(db_path):
+        if not args.generate:
+            raise SystemExit(f"{db_path} does not exist; create it with database/generate.py or pass --generate")
+        from database.generate import generate
+        from database.models import Database
+        db = Database(args.db)
+        generate(db, seed=args.seed)
+        db.close()
+
+    # Benchmark writes (orders, reviews, wishlist) would otherwise change the
+    # data every run, so by default work on a fresh copy each time
+    work_path = db_path
+    if not args.in_place:
+        handle, work_path = tempfile.mkstemp(suffix='.db', prefix='bench-')
+        os.close(handle)
+        source, target = sqlite3.connect(db_path), sqlite3.connect(work_path)
+        source.backup(target)
+        source.close()
+        target.close()
+
+    try:
+        exit_code = run(args, work_path)
+    finally:
+        if work_path != db_path:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(work_path + suffix):
+                    os.remove(work_path + suffix)
+    sys.exit(exit_code)
+
+
+def run(args, db_path):
+    """Run the selected modes against db_path, returning a process exit code"""
+    os.environ['DATABASE_NAME'] = db_path
+    from app import create_app
+    from app.extensions import db
+    app = create_app()
+
+    try:
+        return benchmark(app, args, db_path)
+    finally:
+        db.close()
+
+
+def benchmark(app, args, db_path):
+    from app.extensions import db
+    # The fixture's login is the first query, so it opens the pool and checks the schema
+    fx = Fixture(app.test_client(), db_path, args.seed, args.email, args.password)
+    scenarios = build_scenarios(fx)
+    startup = {
+        'create_app_ms': round(app.startup_seconds * 1000, 2),
+        'db_bootstrap_ms': round((db.bootstrap_seconds or 0) * 1000, 2)
+    }
+    print(f"Startup: create_app {startup['create_app_ms']:.1f} ms, "
+          f"database bootstrap {startup['db_bootstrap_ms']:.1f} ms")
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'startup': startup,
+            'args': vars(args)
+        }
+    }
+
+    if args.mode in ('micro', 'both'):
+        print(f"Microbenchmark ({args.iterations} requests per endpoint, 1 thread)")
+        results['micro'] = run_micro(app, fx, scenarios, args.iterations, args.warmup)
+
+    if args.mode in ('load', 'both'):
+        print(f"Load test ({args.threads} threads for {args.duration:.0f}s)")
+        results['load'] = run_load(app, fx, scenarios, args.threads, args.duration, args.seed)
+
+    if args.mode == 'contention':
+        print(f"Contention test ({args.buyers} buyers, {args.stock} units of one product)")
+        results['contention'] = run_contention(app, fx, db_path, args.buyers, args.stock, args.quantity)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if results.get('contention', {}).get('oversold'):
+        return 1
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:.0f}%:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions over {args.threshold:.0f}% compared to {args.compare}")
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""Generate a large synthetic database for benchmarking.
+
+Example:
+    python database/generate.py --db bench.db --users 100000 --products 200000 \
+        --orders 1000000 --reviews 500000 --wishlist 300000 --seed 42
+"""
+import sys
+import os
+import argparse
+import itertools
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add parent directory to path to import models
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from database.models import Database, Review, batched
+from database.passwords import PasswordHasher
+
+CATEGORIES = {
+    'clothing': (['Sweater', 'Jacket', 'Scarf', 'Beanie', 'Hoodie', 'Jeans', 'Pajama Set', 'Gloves'],
+                 ['S', 'M', 'L', 'XL']),
+    'electronics': (['Earbuds', 'Speaker', 'Smartwatch', 'Power Bank', 'Headphones', 'Charger', 'Camera'],
+                    None),
+    'home-decor': (['String Lights', 'Wreath', 'Candle Set', 'Ornament Set', 'Throw Pillow', 'Table Runner'],
+                   None),
+    'toys': (['Teddy Bear', 'Building Blocks', 'Puzzle', 'Board Game', 'RC Car', 'Doll House'],
+             None),
+    'kitchenware': (['Coffee Mug', 'Baking Mat', 'Cookie Cutters', 'Knife Set', 'Tea Kettle', 'Apron'],
+                    ['One Size'])
+}
+
+ADJECTIVES = ['Festive', 'Cozy', 'Classic', 'Deluxe', 'Rustic', 'Modern', 'Holiday', 'Winter',
+              'Sparkling', 'Vintage', 'Premium', 'Handmade', 'Snowy', 'Merry', 'Golden', 'Ruby']
+TAGS = ['gift', 'holiday', 'christmas', 'winter', 'sale', 'bestseller', 'new', 'eco',
+        'premium', 'kids', 'family', 'cozy', 'limited', 'handmade', 'decor', 'tech']
+DEAL_TYPES = ['holiday_special', 'flash_sale', 'clearance']
+STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+PAYMENT_METHODS = ['COD', 'gcash', 'bank', 'card']
+COMMENTS = ['Great quality, would buy again.', 'Arrived on time and as described.',
+            'Perfect gift for the holidays!', 'Not quite what I expected.',
+            'Excellent value for the price.', 'My kids love it.', None]
+
+# Rating distribution skewed towards positive reviews, like real storefronts
+STAR_WEIGHTS = [5, 7, 15, 33, 40]
+
+
+def timestamp(rng, start, span_seconds):
+    """Random SQLite timestamp within span_seconds after start"""
+    return (start + timedelta(seconds=rng.randrange(span_seconds))).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def zipf_weights(count, exponent=1.1):
+    """Cumulative popularity weights: a few items get most of the traffic"""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class DataGenerator:
+    """Writes users, products, orders, reviews and wishlist items in large batches"""
+
+    def __init__(self, db, seed=42, batch_size=50000, password='test123'):
+        self.db = db
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.password = password
+        self.now = datetime(2026, 1, 1)
+        self.start = self.now - timedelta(days=730)
+        self.span = int((self.now - self.start).total_seconds())
+        self.user_ids = []
+        self.product_ids = []
+        self.product_prices = []
+
+    def _write(self, query, rows):
+        """Insert rows in batch_size chunks, one transaction per chunk.
+
+        Returns the rows actually inserted, which excludes any an INSERT OR
+        IGNORE skipped.
+        """
+        conn = self.db.conn
+        written = 0
+        for batch in batched(rows, self.batch_size):
+            conn.execute("BEGIN")
+            cursor = self.db.execute_many(query, batch)
+            conn.commit()
+            written += cursor.rowcount
+        return written
+
+    def users(self, count):
+        """Create count users sharing one password hash (hashing each would dominate runtime)"""
+        password_hash = PasswordHasher().hash(self.password)
+        first = self.db.execute_query("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0] + 1
+        rows = (
+            (f"user{first + i}@example.com", password_hash, f"User {first + i}",
+             timestamp(self.rng, self.start, self.span))
+            for i in range(count)
+        )
+        written = self._write(
+            "INSERT INTO users (email, password_hash, name, created_at) VALUES (?, ?, ?, ?)", rows
+        )
+        self.user_ids = [row[0] for row in self.db.execute_query("SELECT id FROM users").fetchall()]
+        return written
+
+    def products(self, count):
+        """Create count products spread across the storefront categories"""
+        rng = self.rng
+        categories = list(CATEGORIES)
+
+        def rows():
+            for i in range(count):
+                category = categories[i % len(categories)]
+                nouns, sizes = CATEGORIES[category]
+                price = round(min(max(rng.lognormvariate(7, 0.8), 99), 50000), 2)
+                on_sale = rng.random() < 0.3
+                discount = rng.choice([10, 15, 20, 25, 30, 40, 50]) if on_sale else 0
+                yield (
+                    str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                    f"{rng.choice(ADJECTIVES)} {rng.choice(ADJECTIVES)} {rng.choice(nouns)} {i}",
+                    f"A {category.replace('-', ' ')} favourite. " * rng.randint(2, 8),
+                    round(price * (100 - discount) / 100, 2),
+                    price,
+                    category,
+                    f"https://images.example.com/{category}/{i}.jpg",
+                    round(rng.uniform(3.0, 5.0), 1),
+                    int(on_sale),
+                    json.dumps(sizes) if sizes else None,
+                    discount,
+                    rng.choice(DEAL_TYPES) if on_sale else None,
+                    (self.now + timedelta(days=rng.randint(1, 30))).isoformat() if on_sale else None,
+                    rng.randint(0, 500),
+                    json.dumps(rng.sample(TAGS, rng.randint(1, 4))),
+                    timestamp(rng, self.start, self.span)
+                )
+
+        written = self._write(
+            """INSERT INTO products
+               (id, name, description, price, original_price, category, image, rating,
+                is_on_sale, sizes, discount, deal_type, deal_ends, stock_left, tags, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows()
+        )
+        catalog = self.db.execute_query("SELECT id, price FROM products").fetchall()
+        self.product_ids = [row['id'] for row in catalog]
+        self.product_prices = [row['price'] for row in catalog]
+        return written
+
+    def orders(self, count, mean_basket=2.5, max_basket=30):
+        """Create count orders; basket sizes follow a geometric distribution"""
+        if mean_basket <= 1:
+            raise ValueError("mean_basket must be greater than 1")
+        rng = self.rng
+        popularity = zipf_weights(len(self.product_ids))
+        first = self.db.execute_query("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0] + 1
+        headers = []
+        items = []
+        conn = self.db.conn
+        written = 0
+        # Geometric basket sizes with the requested mean (at least one item)
+        log_continue = math.log(1 - 1 / mean_basket)
+
+        for offset in range(count):
+            order_id = first + offset
+            basket = min(1 + int(math.log(1.0 - rng.random()) / log_continue), max_basket)
+            picks = rng.choices(range(len(self.product_ids)), cum_weights=popularity, k=basket)
+            total = 0.0
+            for index in picks:
+                quantity = rng.choices([1, 2, 3, 4], weights=[70, 20, 7, 3])[0]
+                price = self.product_prices[index]
+                total += price * quantity
+                items.append((order_id, self.product_ids[index], quantity, price, None))
+            created_at = timestamp(rng, self.start, self.span)
+            headers.append((
+                order_id, rng.choice(self.user_ids), round(total, 2), rng.choice(STATUSES),
+                f"{rng.randint(1, 999)} Main Street", rng.choice(PAYMENT_METHODS), created_at, created_at
+            ))
+
+            if len(headers) >= self.batch_size or offset == count - 1:
+                conn.execute("BEGIN")
+                cursor = self.db.execute_many(
+                    """INSERT INTO orders (id, user_id, total_amount, status, shipping_address,
+                       payment_method, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    headers
+                )
+                self.db.execute_many(
+                    """INSERT INTO order_items (order_id, product_id, quantity, price, size)
+                       VALUES (?, ?, ?, ?, ?)""",
+                    items
+                )
+                conn.commit()
+                written += cursor.rowcount
+                headers.clear()
+                items.clear()
+        return written
+
+    def reviews(self, count):
+        """Create count reviews on popular products, then rebuild rating aggregates"""
+        rng = self.rng
+        popularity = zipf_weights(len(self.product_ids))
+        rows = (
+            (self.product_ids[rng.choices(range(len(self.product_ids)), cum_weights=popularity)[0]],
+             rng.choice(self.user_ids),
+             rng.choices(range(1, 6), weights=STAR_WEIGHTS)[0],
+             rng.choice(COMMENTS),
+             timestamp(rng, self.start, self.span))
+            for _ in range(count)
+        )
+        written = self._write(
+            "INSERT INTO reviews (product_id, user_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        Review(self.db).recompute_ratings()
+        return written
+
+    def wishlist(self, count):
+        """Create up to count wishlist items (duplicates are skipped)"""
+        rng = self.rng
+        popularity = zipf_weights(len(self.product_ids))
+        rows = (
+            (rng.choice(self.user_ids),
+             self.product_ids[rng.choices(range(len(self.product_ids)), cum_weights=popularity)[0]],
+             timestamp(rng, self.start, self.span))
+            for _ in range(count)
+        )
+        return self._write(
+            "INSERT OR IGNORE INTO wishlist_items (user_id, product_id, created_at) VALUES (?, ?, ?)",
+            rows
+        )
+
+
+def generate(db, users=1000, products=5000, orders=20000, reviews=10000, wishlist=5000,
+             seed=42, batch_size=50000, log=print):
+    """Fill db with synthetic data and return the row counts written"""
+    generator = DataGenerator(db, seed=seed, batch_size=batch_size)
+    counts = {}
+    # Bulk loading does not need per-transaction durability
+    db.conn.execute("PRAGMA synchronous = OFF")
+    try:
+        for name, count in [('users', users), ('products', products), ('orders', orders),
+                            ('reviews', reviews), ('wishlist', wishlist)]:
+            started = time.perf_counter()
+            counts[name] = getattr(generator, name)(count)
+            log(f"Generated {counts[name]} {name} in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.conn.execute(f"PRAGMA synchronous = {db.profile['synchronous']}")
+    db.conn.execute("ANALYZE")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Ruby's eShop database")
+    parser.add_argument('--db', default='bench.db', help='Database file (relative to backend/)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=10000)
+    parser.add_argument('--wishlist', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for repeatable data')
+    parser.add_argument('--batch-size', type=int, default=50000, help='Rows per transaction')
+    args = parser.parse_args()
+
+    if args.users < 1 or args.products < 1:
+        parser.error('--users and --products must be at least 1')
+
+    db = Database(args.db)
+    started = time.perf_counter()
+    generate(db, users=args.users, products=args.products, orders=args.orders,
+             reviews=args.reviews, wishlist=args.wishlist, seed=args.seed,
+             batch_size=args.batch_size)
+    print(f"Database {db.db_path} generated in {time.perf_counter() - started:.1f}s "
+          f"(every user's password is 'test123')")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
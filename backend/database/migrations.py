@@ -0,0 +1,221 @@
+"""Versioned schema migrations applied on top of Database.create_tables"""
+import sqlite3
+
+def _backfill_rating_aggregates(conn):
+    """Fill the rating aggregate columns from existing reviews"""
+    buckets = ',\n'.join(
+        f"rating_{star} = (SELECT COUNT(*) FROM reviews r WHERE r.product_id = products.id"
+        f" AND CAST(r.rating + 0.5 AS INTEGER) = {star})"
+        for star in range(1, 6)
+    )
+    conn.execute(f"""
+        UPDATE products SET
+            rating_count = (SELECT COUNT(*) FROM reviews r WHERE r.product_id = products.id),
+            rating_sum = (SELECT COALESCE(SUM(r.rating), 0) FROM reviews r WHERE r.product_id = products.id),
+            {buckets}
+    """)
+    conn.execute("UPDATE products SET rating = rating_sum / rating_count WHERE rating_count > 0")
+
+
+# Full-text index over the catalog and the triggers keeping it in sync
+SEARCH_INDEX_STEPS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+           name, description, category, tags,
+           content='products', content_rowid='rowid',
+           tokenize='porter unicode61 remove_diacritics 2',
+           prefix='2 3'
+       )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+           INSERT INTO products_fts (rowid, name, description, category, tags)
+           VALUES (new.rowid, new.name, new.description, new.category, new.tags);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+           INSERT INTO products_fts (products_fts, rowid, name, description, category, tags)
+           VALUES ('delete', old.rowid, old.name, old.description, old.category, old.tags);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update
+       AFTER UPDATE OF name, description, category, tags ON products BEGIN
+           INSERT INTO products_fts (products_fts, rowid, name, description, category, tags)
+           VALUES ('delete', old.rowid, old.name, old.description, old.category, old.tags);
+           INSERT INTO products_fts (rowid, name, description, category, tags)
+           VALUES (new.rowid, new.name, new.description, new.category, new.tags);
+       END""",
+    # Index products that existed before the table was created
+    "INSERT INTO products_fts (products_fts) VALUES ('rebuild')"
+]
+
+
+def fts5_available(conn):
+    """Whether this SQLite build can create FTS5 tables"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+    except sqlite3.OperationalError as e:
+        if 'no such module' in str(e):
+            return False
+        raise
+    conn.execute("DROP TABLE temp.fts5_probe")
+    return True
+
+
+def _create_search_index(conn):
+    """Create the FTS5 product index, skipped when SQLite was built without FTS5"""
+    if not fts5_available(conn):
+        print("SQLite has no FTS5 support; product search will use unindexed LIKE queries")
+        return
+    for step in SEARCH_INDEX_STEPS:
+        conn.execute(step)
+
+
+# Ordered list of (version, description, steps). A step is either a SQL
+# statement or a callable taking the connection, for data migrations and
+# steps that depend on the SQLite build.
+# Never edit a released migration; append a new one instead.
+MIGRATIONS = [
+    (1, "Secondary indexes for order, review, category and wishlist lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_reviews_product_created ON reviews (product_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_products_category ON products (category)",
+        "CREATE INDEX IF NOT EXISTS idx_products_is_on_sale ON products (is_on_sale)",
+        "CREATE INDEX IF NOT EXISTS idx_wishlist_user_created ON wishlist_items (user_id, created_at)"
+    ]),
+    (2, "FTS5 full-text index over product name, description, category and tags", [
+        _create_search_index
+    ]),
+    (3, "Catalog version counter bumped by every product, review or reviewer name change", [
+        """CREATE TABLE IF NOT EXISTS catalog_version (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               version INTEGER NOT NULL
+           )""",
+        "INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 1)",
+        """CREATE TRIGGER IF NOT EXISTS catalog_version_product_insert AFTER INSERT ON products BEGIN
+               UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS catalog_version_product_update AFTER UPDATE ON products BEGIN
+               UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS catalog_version_product_delete AFTER DELETE ON products BEGIN
+               UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS catalog_version_review_insert AFTER INSERT ON reviews BEGIN
+               UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS catalog_version_review_delete AFTER DELETE ON reviews BEGIN
+               UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+           END""",
+        # Review listings show the reviewer's name
+        """CREATE TRIGGER IF NOT EXISTS catalog_version_user_name AFTER UPDATE OF name ON users BEGIN
+               UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+           END"""
+    ]),
+    (4, "Incremental rating aggregates (sum, count, per-star histogram) on products", [
+        "ALTER TABLE products ADD COLUMN rating_sum REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_1 INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_2 INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_3 INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_4 INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE products ADD COLUMN rating_5 INTEGER NOT NULL DEFAULT 0",
+        _backfill_rating_aggregates
+    ]),
+    (5, "Revoked JWT tokens", [
+        """CREATE TABLE IF NOT EXISTS revoked_tokens (
+               token_hash TEXT PRIMARY KEY,
+               user_id INTEGER,
+               expires_at REAL NOT NULL
+           )"""
+    ]),
+    (6, "Catalog version ignores checkout stock decrements", [
+        # Orders only change stock_left, which every worker re-reads at checkout;
+        # admin edits and imports always set updated_at, so they still bump it
+        "DROP TRIGGER IF EXISTS catalog_version_product_update",
+        """CREATE TRIGGER catalog_version_product_update
+           AFTER UPDATE OF id, name, description, price, original_price, category, image,
+               rating, is_on_sale, sizes, discount, deal_type, deal_ends, tags, updated_at,
+               rating_sum, rating_count, rating_1, rating_2, rating_3, rating_4, rating_5
+           ON products BEGIN
+               UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+           END"""
+    ]),
+    (7, "Stock version counter bumped by every stock_left change", [
+        "ALTER TABLE catalog_version ADD COLUMN stock_version INTEGER NOT NULL DEFAULT 0",
+        """CREATE TRIGGER IF NOT EXISTS catalog_stock_version AFTER UPDATE OF stock_left ON products BEGIN
+               UPDATE catalog_version SET stock_version = stock_version + 1 WHERE id = 1;
+           END"""
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def ensure_version_table(conn):
+    """Create the schema_version bookkeeping table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def current_version(conn):
+    """Return the highest applied migration version (0 for a fresh database)"""
+    ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def stored_version(conn):
+    """Return the applied schema version without creating anything (0 if untracked)"""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def pending(conn):
+    """Return the migrations that have not been applied yet"""
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def upgrade(conn, target=None):
+    """Apply pending migrations in order, each in its own transaction.
+
+    Safe to run concurrently from several processes: the version is re-read
+    under a write lock, so a migration is applied exactly once.
+    Returns the list of versions applied by this call.
+    """
+    applied = []
+    if conn.in_transaction:
+        conn.commit()
+    
+    for version, description, steps in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+            applied.append(version)
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    
+    return applied
@@ -1,53 +1,484 @@
 import sqlite3
 import json
+import base64
+import functools
+import itertools
 import os
-import hashlib
-import secrets
-from datetime import datetime
+import re
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from database import migrations
+from database.cache import LRUCache
+from database.profiling import SlowQueryLog
+from database.passwords import default_hasher
+
+# SQLite settings applied to every new connection. WAL lets product reads run
+# while an order or wishlist write is in progress.
+DEFAULT_PROFILE = {
+    'busy_timeout': 5000,            # milliseconds to wait on a locked database
+    'journal_mode': 'wal',
+    'synchronous': 'normal',         # safe with WAL, one fsync per checkpoint
+    'cache_size': -64000,            # negative values are KiB (64 MB)
+    'mmap_size': 268435456,          # 256 MB memory-mapped I/O
+    'temp_store': 'memory'
+}
+
+# PRAGMA queries report these settings as integers
+PROFILE_NAMES = {
+    'synchronous': ['off', 'normal', 'full', 'extra'],
+    'temp_store': ['default', 'file', 'memory']
+}
+
+PROFILE_CHOICES = {
+    'journal_mode': {'delete', 'truncate', 'persist', 'memory', 'wal', 'off'},
+    'synchronous': {'off', 'normal', 'full', 'extra'},
+    'temp_store': {'default', 'file', 'memory'}
+}
+
+
+def build_pragmas(profile):
+    """Validate a connection profile and turn it into PRAGMA statements"""
+    statements = []
+    for name, value in profile.items():
+        if name not in DEFAULT_PROFILE:
+            raise ValueError(f"Unknown database profile setting: {name}")
+        
+        if name in PROFILE_CHOICES:
+            value = str(value).lower()
+            if value not in PROFILE_CHOICES[name]:
+                raise ValueError(f"Invalid value for {name}: {value}")
+        else:
+            value = int(value)
+        
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+class ResultPage(list):
+    """List of results that also carries the cursor for the following page"""
+
+    def __init__(self, items=(), next_cursor=None, total=None):
+        super().__init__(items)
+        self.next_cursor = next_cursor
+        self.total = total
+
+
+def encode_cursor(values):
+    """Encode sort key values as an opaque, URL-safe pagination cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size, kinds=(int, float)):
+    """Decode a pagination cursor, raising ValueError if it was tampered with"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    if not all(isinstance(v, kinds) and not isinstance(v, bool) for v in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+# Largest page a listing returns; bigger requests get this many rows and a cursor
+MAX_PAGE_SIZE = 500
+
+
+def page_limit(limit):
+    """Validate a requested page size and cap it at MAX_PAGE_SIZE (None means no limit)"""
+    if limit is None:
+        return None
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+# Values bound per IN (...) list, below SQLite's historical 999 variable limit
+IN_CHUNK_SIZE = 500
+
+
+def batched(iterable, size=IN_CHUNK_SIZE):
+    """Yield lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def placeholders(count):
+    """Comma-separated ? placeholders for an IN (...) list"""
+    return ', '.join('?' * count)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections with checkout/return semantics"""
+
+    def __init__(self, db_path, size=5, timeout=30.0, pragmas=None):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas or []
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _open(self):
+        """Open a new connection to the database file"""
+        # Connections are handed between threads by the pool, but only one
+        # thread ever holds a given connection at a time
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Check out a connection, opening a new one while under the size limit"""
+        if self._closed:
+            raise PoolTimeout("Connection pool is closed")
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._created < self.size
+            if can_open:
+                self._created += 1
+
+        if can_open:
+            try:
+                return self._open()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        if conn.in_transaction:
+            conn.rollback()
+
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+
+        self._idle.put(conn)
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        """Return the number of open and idle connections"""
+        return {
+            'size': self.size,
+            'open': self._created,
+            'idle': self._idle.qsize()
+        }
+
 
 class Database:
-    def __init__(self, db_name="rubyshop.db"):
+    def __init__(self, db_name="rubyshop.db", pool_size=5, pool_timeout=30.0, profile=None,
+                 cache_size=1024, cache_ttl=300, auth_cache_size=4096, auth_cache_ttl=30):
         self.db_name = db_name
-        self.conn = None
-        self.cursor = None
-        self.connect()
-        self.create_tables()
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.profile = dict(DEFAULT_PROFILE, **(profile or {}))
+        # Catalog cache shared by every model using this database
+        self.cache = LRUCache(max_entries=cache_size, ttl=cache_ttl)
+        self._catalog_version = None
+        # Bumped by every stock_left change; read together with the catalog version
+        self.stock_version = None
+        # Short-lived cache of users and decoded tokens for authenticated requests
+        self.auth_cache = LRUCache(max_entries=auth_cache_size, ttl=auth_cache_ttl)
+        # Callables run as hook(query, params, seconds) after each statement; queries
+        # are only timed while at least one hook is registered
+        self.query_hooks = []
+        self.slow_query_log = None
+        # The pool is opened and the schema checked on first use, so importing
+        # modules that share this object touches no files
+        self.pool = None
+        self._connect_lock = threading.Lock()
+        # Seconds the last connect() spent opening the pool and checking the schema
+        self.bootstrap_seconds = None
+        # Apply pending migrations when the pool is opened; the db upgrade command
+        # turns this off to migrate step by step
+        self.auto_migrate = True
+        self._full_text_search = None
+        self._local = threading.local()
+    
+    @property
+    def db_path(self):
+        return os.path.join(os.path.dirname(os.path.dirname(__file__)), self.db_name)
     
     def connect(self):
-        """Establish a connection to the database"""
+        """(Re)open the connection pool and bring the schema up to date"""
+        self.close()
         try:
-            db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), self.db_name)
-            self.conn = sqlite3.connect(db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-            self.cursor = self.conn.cursor()
+            with self._connect_lock:
+                self._open_pool()
             return True
         except sqlite3.Error as e:
             print(f"Database connection error: {e}")
             return False
     
+    def _open_pool(self):
+        started = time.perf_counter()
+        pool = ConnectionPool(
+            self.db_path,
+            size=self.pool_size,
+            timeout=self.pool_timeout,
+            pragmas=build_pragmas(self.profile)
+        )
+        # Check the schema on a connection of the new pool before publishing it,
+        # so other threads never see a pool whose tables may not exist yet
+        self._local.conn = pool.acquire()
+        try:
+            self.ensure_schema()
+        except sqlite3.Error:
+            pool.close()
+            raise
+        finally:
+            conn, self._local.conn = self._local.conn, None
+            pool.release(conn)
+        self.pool = pool
+        self._full_text_search = None
+        self.bootstrap_seconds = time.perf_counter() - started
+    
+    def ensure_schema(self):
+        """Create tables and apply migrations unless the stored schema is already current.
+        
+        Returns True when the schema had to be brought up to date.
+        """
+        if migrations.stored_version(self.conn) >= migrations.LATEST_VERSION:
+            return False
+        self.create_tables(migrate=self.auto_migrate)
+        return True
+    
+    def init_app(self, app):
+        """Configure the database from app config and bind connections to the app context"""
+        db_name = app.config.get('DATABASE_NAME', self.db_name)
+        pool_size = app.config.get('DATABASE_POOL_SIZE', self.pool_size)
+        pool_timeout = app.config.get('DATABASE_POOL_TIMEOUT', self.pool_timeout)
+        profile = dict(self.profile)
+        for name in DEFAULT_PROFILE:
+            key = f"DATABASE_{name.upper()}"
+            if app.config.get(key) is not None:
+                profile[name] = app.config[key]
+        
+        current = (self.db_name, self.pool_size, self.pool_timeout, self.profile)
+        if (db_name, pool_size, pool_timeout, profile) != current:
+            # A pool opened with the old settings is dropped; the next query reopens it
+            self.close()
+            self.db_name = db_name
+            self.pool_size = pool_size
+            self.pool_timeout = pool_timeout
+            self.profile = profile
+        
+        self.cache = LRUCache(
+            max_entries=app.config.get('CATALOG_CACHE_SIZE', self.cache.max_entries),
+            ttl=app.config.get('CATALOG_CACHE_TTL', self.cache.ttl)
+        )
+        self.auth_cache = LRUCache(
+            max_entries=app.config.get('AUTH_CACHE_SIZE', self.auth_cache.max_entries),
+            ttl=app.config.get('AUTH_CACHE_TTL', self.auth_cache.ttl)
+        )
+        
+        # Slow-query log, disabled unless a threshold is configured
+        if self.slow_query_log is not None:
+            self.remove_query_hook(self.slow_query_log)
+            self.slow_query_log = None
+        if app.config.get('SLOW_QUERY_MS') is not None:
+            self.slow_query_log = SlowQueryLog(
+                self,
+                threshold_ms=float(app.config['SLOW_QUERY_MS']),
+                explain=app.config.get('SLOW_QUERY_EXPLAIN', True)
+            )
+            self.add_query_hook(self.slow_query_log)
+        
+        # Every request (app context) returns its connection to the pool when done
+        app.teardown_appcontext(self.release)
+    
+    @property
+    def conn(self):
+        """Connection checked out by the current thread, acquired on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.pool is None:
+                with self._connect_lock:
+                    if self.pool is None:
+                        self._open_pool()
+            conn = self.pool.acquire()
+            self._local.conn = conn
+        return conn
+    
+    def catalog_version(self):
+        """Return the catalog version, clearing the local cache if another process changed it.
+        
+        Also refreshes stock_version, dropping cached entries that show stock
+        when only stock has changed.
+        """
+        cursor = self.execute_query("SELECT version, stock_version FROM catalog_version WHERE id = 1")
+        row = cursor.fetchone()
+        cursor.close()
+        version, stock_version = (row[0], row[1]) if row else (0, 0)
+        
+        # Writes from other workers bump the version without touching this
+        # process's cache, so drop everything we have when it moves
+        if version != self._catalog_version:
+            if self._catalog_version is not None:
+                self.cache.clear()
+            self._catalog_version = version
+        elif stock_version != self.stock_version and self.stock_version is not None:
+            self.cache.invalidate_tag(STOCK_TAG)
+        self.stock_version = stock_version
+        return version
+    
+    def has_full_text_search(self):
+        """Whether the products_fts index exists (migration 2 skips it without FTS5)"""
+        if self._full_text_search is None:
+            cursor = self.execute_query(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+            )
+            self._full_text_search = cursor.fetchone() is not None
+            cursor.close()
+        return self._full_text_search
+    
+    def active_profile(self):
+        """Report the settings SQLite is actually using on the current connection"""
+        active = {}
+        for name in DEFAULT_PROFILE:
+            row = self.conn.execute(f"PRAGMA {name}").fetchone()
+            value = row[0] if row else None
+            if name in PROFILE_NAMES and isinstance(value, int):
+                value = PROFILE_NAMES[name][value]
+            active[name] = value
+        return active
+    
+    def release(self, exception=None):
+        """Return the current thread's connection to the pool"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            if self.pool is not None:
+                self.pool.release(conn)
+            else:
+                # Checked out before close(); its pool is gone
+                conn.close()
+    
     def close(self):
-        """Close the database connection"""
-        if self.conn:
-            self.conn.close()
+        """Close the database connection pool; the next query opens a new one"""
+        if self.pool:
+            self.release()
+            self.pool.close()
+            self.pool = None
     
     def execute_query(self, query, params=None):
         """Execute a query with its own cursor to avoid recursion issues"""
         cursor = self.conn.cursor()
+        started = time.perf_counter() if self.query_hooks else None
         try:
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
-            return cursor
         except sqlite3.Error as e:
             print(f"Query execution error: {e}")
             cursor.close()
             raise
+        if started is not None:
+            self._run_query_hooks(query, params, time.perf_counter() - started)
+        return cursor
+    
+    def execute_many(self, query, seq_of_params):
+        """Execute a statement once per parameter set in a single call"""
+        cursor = self.conn.cursor()
+        started = time.perf_counter() if self.query_hooks else None
+        try:
+            cursor.executemany(query, seq_of_params)
+        except sqlite3.Error as e:
+            print(f"Query execution error: {e}")
+            cursor.close()
+            raise
+        if started is not None:
+            self._run_query_hooks(query, None, time.perf_counter() - started)
+        return cursor
     
-    def create_tables(self):
-        """Create all required tables if they don't exist"""
+    def stream_query(self, query, params=None, batch_size=500):
+        """Execute a query now and return a generator fetching its rows in batches.
+
+        Errors in the statement surface immediately; rows are read with
+        fetchmany as the generator is consumed, so memory stays bounded by
+        batch_size however many rows match.
+        """
+        cursor = self.execute_query(query, params)
+        
+        def rows():
+            try:
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        return
+                    yield from batch
+            finally:
+                cursor.close()
+        return rows()
+    
+    def add_query_hook(self, hook):
+        """Register hook(query, params, seconds) to observe every executed statement"""
+        if hook not in self.query_hooks:
+            self.query_hooks.append(hook)
+    
+    def remove_query_hook(self, hook):
+        """Stop passing statements to a previously registered hook"""
+        if hook in self.query_hooks:
+            self.query_hooks.remove(hook)
+    
+    def _run_query_hooks(self, query, params, seconds):
+        """Report a finished statement to the registered hooks"""
+        for hook in self.query_hooks:
+            try:
+                hook(query, params, seconds)
+            except Exception as e:
+                print(f"Query hook error: {e}")
+    
+    def create_tables(self, migrate=True):
+        """Create all required tables if they don't exist, then apply pending migrations"""
+        cursor = self.conn.cursor()
+        
         # Users table
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 email TEXT UNIQUE NOT NULL,
@@ -59,7 +490,7 @@ class Database:
         ''')
         
         # Products table
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS products (
                 id TEXT PRIMARY KEY,
                 name TEXT NOT NULL,
@@ -82,7 +513,7 @@ class Database:
         ''')
         
         # Orders table
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS orders (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
@@ -97,7 +528,7 @@ class Database:
         ''')
         
         # Order items table
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS order_items (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 order_id INTEGER NOT NULL,
@@ -112,7 +543,7 @@ class Database:
         ''')
         
         # Reviews table
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS reviews (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 product_id TEXT NOT NULL,
@@ -126,7 +557,7 @@ class Database:
         ''')
         
         # Wishlist table
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS wishlist_items (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
@@ -139,22 +570,39 @@ class Database:
         ''')
         
         self.conn.commit()
+        
+        # Bring indexes and later schema changes up to date
+        if migrate:
+            self.migrate()
+    
+    def migrate(self, target=None):
+        """Apply pending schema migrations, returning the versions applied"""
+        try:
+            return migrations.upgrade(self.conn, target)
+        except sqlite3.Error as e:
+            print(f"Migration error: {e}")
+            raise
+    
+    def schema_version(self):
+        """Return the currently applied schema version"""
+        return migrations.current_version(self.conn)
 
 
 class User:
-    def __init__(self, db):
+    def __init__(self, db, hasher=None):
         self.db = db
+        self.hasher = hasher or default_hasher
     
     def create(self, email, password, name=None):
         """Create a new user"""
         try:
             password_hash = self._hash_password(password)
-            self.db.cursor.execute(
+            cursor = self.db.execute_query(
                 "INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)",
                 (email, password_hash, name)
             )
             self.db.conn.commit()
-            return self.db.cursor.lastrowid
+            return cursor.lastrowid
         except sqlite3.IntegrityError:
             return None  # Email already exists
     
@@ -165,18 +613,38 @@ class User:
             return None  # Invalid email format
             
         # Check if email exists in database
-        self.db.cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-        user = self.db.cursor.fetchone()
+        cursor = self.db.execute_query("SELECT * FROM users WHERE email = ?", (email,))
+        user = cursor.fetchone()
         
         # Only validate password if user exists
         if user and self._verify_password(password, user['password_hash']):
+            # Upgrade hashes made with older parameters while we have the password
+            if self.hasher.needs_rehash(user['password_hash']):
+                self._rehash(user['id'], password)
             return dict(user)  # Convert sqlite3.Row to dict
         return None
     
+    def _rehash(self, user_id, password):
+        """Store a new hash for a user using the current parameters"""
+        try:
+            self.db.execute_query(
+                "UPDATE users SET password_hash = ? WHERE id = ?",
+                (self._hash_password(password), user_id)
+            )
+            self.db.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error upgrading password hash: {e}")
+    
     def get_by_id(self, user_id):
-        """Get user by ID"""
-        self.db.cursor.execute("SELECT id, email, name, created_at FROM users WHERE id = ?", (user_id,))
-        user = self.db.cursor.fetchone()
+        """Get user by ID, served from the auth cache when possible"""
+        return self.db.auth_cache.get_or_load(
+            ('user', user_id), lambda: self._load_by_id(user_id), tags=[f"user:{user_id}"]
+        )
+    
+    def _load_by_id(self, user_id):
+        """Read a user from the database"""
+        cursor = self.db.execute_query("SELECT id, email, name, created_at FROM users WHERE id = ?", (user_id,))
+        user = cursor.fetchone()
         return dict(user) if user else None
     
     def update(self, user_id, name=None, email=None):
@@ -200,34 +668,186 @@ class User:
         query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = ?"
         params.append(user_id)
         
-        self.db.cursor.execute(query, params)
+        cursor = self.db.execute_query(query, params)
+        self.db.conn.commit()
+        self.db.auth_cache.invalidate_tag(f"user:{user_id}")
+        return cursor.rowcount > 0
+    
+    def revoke_token(self, token_hash, user_id, expires_at):
+        """Record a token as revoked until it would have expired anyway"""
+        # Expired entries can never match a valid token again
+        self.db.execute_query("DELETE FROM revoked_tokens WHERE expires_at <= ?", (time.time(),))
+        self.db.execute_query(
+            """INSERT OR IGNORE INTO revoked_tokens (token_hash, user_id, expires_at)
+               VALUES (?, ?, ?)""",
+            (token_hash, user_id, expires_at)
+        )
         self.db.conn.commit()
-        return self.db.cursor.rowcount > 0
+    
+    def get_revoked_tokens(self):
+        """Return hashes of revoked tokens that have not expired yet"""
+        cursor = self.db.execute_query(
+            "SELECT token_hash FROM revoked_tokens WHERE expires_at > ?", (time.time(),)
+        )
+        hashes = {row['token_hash'] for row in cursor.fetchall()}
+        cursor.close()
+        return hashes
     
     def _hash_password(self, password):
         """Hash a password using salt"""
-        salt = secrets.token_hex(8)
-        h = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-        return f"{salt}${h.hex()}"
+        return self.hasher.hash(password)
     
     def _verify_password(self, password, stored_hash):
         """Verify a password against its stored hash"""
-        salt, hash_val = stored_hash.split('$')
-        h = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-        return h.hex() == hash_val
+        return self.hasher.verify(password, stored_hash)
+
+
+def rating_bucket(rating):
+    """Histogram star (1-5) a rating is counted under, rounding half up"""
+    return min(5, max(1, int(rating + 0.5)))
+
+
+def format_rating(product):
+    """Replace raw rating aggregate columns with a count and star distribution"""
+    if 'rating_1' in product:
+        product.pop('rating_sum', None)
+        product['rating_distribution'] = {
+            str(star): product.pop(f'rating_{star}', 0) for star in range(1, 6)
+        }
+    return product
+
+
+@functools.lru_cache(maxsize=65536)
+def decode_list(raw):
+    """Decode a JSON list column, parsing each distinct value only once"""
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        return ()
+    return tuple(value) if isinstance(value, list) else ()
+
+
+def format_product(row, drop=()):
+    """Map a products row (plus any joined columns) to its API representation.
+
+    sizes and tags repeat the same few JSON strings across the catalog, so
+    they are decoded through decode_list instead of json.loads per row.
+    """
+    product = dict(row)
+    for key in drop:
+        del product[key]
+    for field in ('sizes', 'tags'):
+        raw = product.get(field)
+        if raw and isinstance(raw, str):
+            product[field] = list(decode_list(raw))
+    if 'is_on_sale' in product:
+        product['is_on_sale'] = bool(product['is_on_sale'])
+    return format_rating(product)
+
+
+def parse_deal_end(value):
+    """Parse an ISO 8601 deal end as an aware UTC datetime (naive values are local time).
+
+    Raises ValueError for anything else.
+    """
+    if not isinstance(value, str):
+        raise ValueError("deal_ends must be an ISO 8601 timestamp")
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc)
+    except ValueError:
+        raise ValueError("deal_ends must be an ISO 8601 timestamp")
+
+
+# Cache tag shared by listings that span categories (all, sale, search)
+LISTING_TAG = 'listings'
+
+# Cache tag of every entry that includes stock_left (see shows_stock)
+STOCK_TAG = 'stock'
+
+
+def shows_stock(columns):
+    """Whether products projected to these resolved columns include stock_left"""
+    return columns is None or 'stock_left' in columns
+
+# Named field sets for the fields= parameter; None selects every column
+FIELD_PROFILES = {
+    'card': ['id', 'name', 'price', 'original_price', 'image', 'category', 'rating',
+             'rating_count', 'is_on_sale', 'discount', 'deal_type', 'deal_ends'],
+    'detail': None
+}
+RATING_COLUMNS = [f'rating_{star}' for star in range(1, 6)]
 
 
 class Product:
     def __init__(self, db):
         self.db = db
     
+    # Columns accepted from API payloads and imports
+    FIELDS = [
+        'id', 'name', 'description', 'price', 'original_price', 'category', 
+        'image', 'rating', 'is_on_sale', 'sizes', 'discount', 'deal_type', 
+        'deal_ends', 'stock_left', 'tags'
+    ]
+    
+    # Fields a client may request with fields=, in response order
+    SELECTABLE = FIELDS + ['created_at', 'rating_count', 'rating_distribution']
+    
+    @classmethod
+    def resolve_fields(cls, fields):
+        """Turn a fields= value (field names and/or profiles, comma separated)
+        into the tuple of columns to select, or None for every column.
+        
+        Raises ValueError for unknown names.
+        """
+        requested = {'id'}
+        unknown = []
+        for name in (fields or '').split(','):
+            name = name.strip()
+            if not name:
+                continue
+            if name in FIELD_PROFILES:
+                if FIELD_PROFILES[name] is None:
+                    return None
+                requested.update(FIELD_PROFILES[name])
+            elif name in cls.SELECTABLE:
+                requested.add(name)
+            else:
+                unknown.append(name)
+        
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if requested == {'id'}:
+            return None
+        
+        columns = []
+        for field in cls.SELECTABLE:
+            if field in requested:
+                columns.extend(RATING_COLUMNS if field == 'rating_distribution' else [field])
+        return tuple(columns)
+    
+    @staticmethod
+    def select_list(columns, alias=''):
+        """SQL select list for the resolved columns"""
+        if columns is None:
+            return f"{alias}*"
+        return ', '.join(f"{alias}{column}" for column in columns)
+    
+    @staticmethod
+    def project(product, columns):
+        """Limit an already formatted product to the resolved columns"""
+        if columns is None or product is None:
+            return product
+        keys = set(columns)
+        if 'rating_1' in keys:
+            keys.add('rating_distribution')
+        return {key: value for key, value in product.items() if key in keys}
+    
     def create(self, product_data):
-        """Create a new product"""
-        fields = [
-            'id', 'name', 'description', 'price', 'original_price', 'category', 
-            'image', 'rating', 'is_on_sale', 'sizes', 'discount', 'deal_type', 
-            'deal_ends', 'stock_left', 'tags'
-        ]
+        """Create a new product; raises ValueError for an invalid deal_ends"""
+        self._check_deal_end(product_data)
+        fields = self.FIELDS
         
         values = []
         placeholders = []
@@ -247,106 +867,434 @@ class Product:
                 placeholders.append('?')
         
         query = f"INSERT INTO products ({', '.join(fields)}) VALUES ({', '.join(placeholders)})"
-        self.db.cursor.execute(query, values)
+        self.db.execute_query(query, values)
         self.db.conn.commit()
+        self.invalidate(product_data['id'], [product_data.get('category')])
         return product_data['id']
     
-    def get_by_id(self, product_id):
+    def bulk_upsert(self, rows, chunk_size=1000):
+        """Insert or update many products using batched transactions.
+
+        ``rows`` may be any iterable (for example a streamed NDJSON body); it is
+        consumed ``chunk_size`` rows at a time, each chunk written with a single
+        executemany and one commit. Items that are Exception instances are
+        reported as errors for that row (the caller could not parse it).
+        Existing products keep values for fields a row leaves out, and keep
+        their review-based rating once they have reviews.
+
+        Returns a summary with per-row errors identified by their index.
+        """
+        fields = self.FIELDS
+        updates = ',\n'.join(
+            f"{field} = COALESCE(excluded.{field}, {field})"
+            for field in fields if field not in ('id', 'rating')
+        )
+        query = f"""
+            INSERT INTO products ({', '.join(fields)})
+            VALUES ({', '.join('?' for _ in fields)})
+            ON CONFLICT(id) DO UPDATE SET
+                {updates},
+                rating = CASE WHEN rating_count > 0 THEN rating
+                              ELSE COALESCE(excluded.rating, rating) END,
+                updated_at = CURRENT_TIMESTAMP
+        """
+        
+        summary = {'received': 0, 'upserted': 0, 'failed': 0, 'errors': []}
+        chunk = []
+        
+        def flush():
+            if chunk:
+                summary['upserted'] += self._write_chunk(query, chunk, summary['errors'])
+                chunk.clear()
+        
+        for index, row in enumerate(rows):
+            summary['received'] += 1
+            try:
+                chunk.append((index, self._validate_row(row)))
+            except ValueError as e:
+                summary['errors'].append({
+                    'index': index,
+                    'id': row.get('id') if isinstance(row, dict) else None,
+                    'error': str(e)
+                })
+            
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+        
+        summary['failed'] = len(summary['errors'])
+        summary['errors'].sort(key=lambda error: error['index'])
+        if summary['upserted']:
+            self.db.cache.clear()
+        return summary
+    
+    def _write_chunk(self, query, chunk, errors):
+        """Write one chunk in a transaction, isolating bad rows if it fails"""
+        conn = self.db.conn
+        try:
+            self.db.execute_many(query, [values for _, values in chunk])
+            conn.commit()
+            return len(chunk)
+        except sqlite3.Error:
+            conn.rollback()
+        
+        # Retry row by row so one bad row does not sink the rest of the chunk
+        written = 0
+        conn.execute("BEGIN")
+        for index, values in chunk:
+            try:
+                conn.execute("SAVEPOINT bulk_row")
+                conn.execute(query, values)
+                conn.execute("RELEASE bulk_row")
+                written += 1
+            except sqlite3.Error as e:
+                conn.execute("ROLLBACK TO bulk_row")
+                conn.execute("RELEASE bulk_row")
+                errors.append({'index': index, 'id': values[0], 'error': str(e)})
+        conn.commit()
+        return written
+    
+    def _validate_row(self, row):
+        """Check an import row and convert it to column values in FIELDS order"""
+        if isinstance(row, Exception):
+            raise ValueError(str(row))
+        if not isinstance(row, dict):
+            raise ValueError("Row must be a JSON object")
+        
+        unknown = set(row) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        
+        if row.get('id') is not None and not isinstance(row['id'], str):
+            raise ValueError("id must be a string")
+        
+        for field in ('name', 'category'):
+            if not isinstance(row.get(field), str) or not row[field].strip():
+                raise ValueError(f"{field} is required")
+        
+        for field in ('price', 'original_price', 'rating', 'discount', 'stock_left'):
+            value = row.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"{field} must be a number")
+        if row.get('price') is None or row['price'] < 0:
+            raise ValueError("price is required and must not be negative")
+        self._check_deal_end(row)
+        
+        values = []
+        for field in self.FIELDS:
+            value = row.get(field)
+            if field == 'id' and not value:
+                value = str(uuid.uuid4())
+            elif field in ('sizes', 'tags') and value is not None:
+                if not isinstance(value, list):
+                    raise ValueError(f"{field} must be a list")
+                value = json.dumps(value)
+            elif field == 'is_on_sale' and value is not None:
+                value = 1 if value else 0
+            values.append(value)
+        return values
+    
+    def get_by_id(self, product_id, columns=None):
         """Get product by ID"""
-        query = "SELECT * FROM products WHERE id = ?"
         try:
-            cursor = self.db.execute_query(query, (product_id,))
-            product = cursor.fetchone()
-            cursor.close()
-            if product:
-                return self._format_product(dict(product))
-            return None
+            # The full product is cached and projected, so every field set shares one entry
+            product = self.db.cache.get_or_load(
+                ('product', product_id), lambda: self._load_by_id(product_id), tags=[STOCK_TAG]
+            )
+            return self.project(product, columns)
         except sqlite3.Error as e:
             print(f"Error fetching product by ID: {e}")
             return None
     
-    def get_all(self, limit=None, offset=None):
-        """Get all products with optional pagination"""
-        query = "SELECT * FROM products"
-        params = []
+    def _load_by_id(self, product_id):
+        """Read a single product from the database"""
+        cursor = self.db.execute_query("SELECT * FROM products WHERE id = ?", (product_id,))
+        product = cursor.fetchone()
+        cursor.close()
+        if product:
+            return format_product(product)
+        return None
+    
+    def warm_cache(self, limit=24):
+        """Load the first listing page overall, on sale and per category into the cache"""
+        self.db.catalog_version()
+        cursor = self.db.execute_query("SELECT DISTINCT category FROM products")
+        categories = [row['category'] for row in cursor.fetchall()]
+        cursor.close()
         
-        if limit:
-            query += " LIMIT ?"
-            params.append(limit)
-            
-            if offset:
-                query += " OFFSET ?"
-                params.append(offset)
+        self.get_all(limit=limit)
+        self.get_on_sale(limit=limit)
+        for category in categories:
+            self.get_by_category(category, limit=limit)
+        return len(categories) + 2
+    
+    def get_many(self, product_ids, columns=None):
+        """Get several products in the order requested, leaving out unknown ids.
+
+        Products already in the cache are served from it; the rest are read
+        with one IN query per IN_CHUNK_SIZE ids and cached like get_by_id.
+        """
+        unique_ids = list(dict.fromkeys(product_ids))
+        cache = self.db.cache
+        found = {}
+        missing = []
+        for product_id in unique_ids:
+            product = cache.get(('product', product_id))
+            if product is None:
+                missing.append(product_id)
+            else:
+                found[product_id] = product
         
         try:
-            cursor = self.db.execute_query(query, params)
-            products = cursor.fetchall()
-            cursor.close()
-            return [self._format_product(dict(p)) for p in products]
+            for chunk in batched(missing):
+                cursor = self.db.execute_query(
+                    f"SELECT * FROM products WHERE id IN ({placeholders(len(chunk))})", chunk
+                )
+                for row in cursor.fetchall():
+                    product = format_product(row)
+                    cache.set(('product', product['id']), product, tags=[STOCK_TAG])
+                    found[product['id']] = product
+                cursor.close()
         except sqlite3.Error as e:
-            print(f"Error fetching all products: {e}")
+            print(f"Error fetching products by ID: {e}")
             return []
+        
+        return [self.project(found[product_id], columns)
+                for product_id in unique_ids if product_id in found]
+    
+    def get_all(self, limit=None, offset=None, cursor=None, with_total=False, columns=None):
+        """Get all products with optional pagination"""
+        try:
+            return self.db.cache.get_or_load(
+                ('all', limit, offset, cursor, with_total, columns),
+                lambda: self._fetch_page(
+                    f"SELECT {self.select_list(columns)}, rowid AS _rowid FROM products", [],
+                    limit=limit, offset=offset, cursor=cursor, with_total=with_total
+                ),
+                tags=self._cache_tags(LISTING_TAG, columns)
+            )
+        except sqlite3.Error as e:
+            print(f"Error fetching all products: {e}")
+            return ResultPage()
     
-    def get_by_category(self, category, limit=None):
+    def get_by_category(self, category, limit=None, cursor=None, with_total=False, columns=None):
         """Get products by category"""
-        query = "SELECT * FROM products WHERE category = ?"
-        params = [category]
-        
-        if limit:
-            query += " LIMIT ?"
-            params.append(limit)
-        
         try:
-            cursor = self.db.execute_query(query, params)
-            products = cursor.fetchall()
-            cursor.close()
-            return [self._format_product(dict(p)) for p in products]
+            return self.db.cache.get_or_load(
+                ('category', category, limit, cursor, with_total, columns),
+                lambda: self._fetch_page(
+                    f"SELECT {self.select_list(columns)}, rowid AS _rowid FROM products WHERE category = ?",
+                    [category],
+                    limit=limit, cursor=cursor, with_total=with_total
+                ),
+                tags=self._cache_tags(f"category:{category}", columns)
+            )
         except sqlite3.Error as e:
             print(f"Error fetching products by category: {e}")
-            return []
+            return ResultPage()
     
-    def get_on_sale(self, limit=None):
+    def get_on_sale(self, limit=None, cursor=None, with_total=False, columns=None):
         """Get products that are on sale"""
-        query = "SELECT * FROM products WHERE is_on_sale = 1"
-        params = []
+        try:
+            return self.db.cache.get_or_load(
+                ('sale', limit, cursor, with_total, columns),
+                lambda: self._fetch_page(
+                    f"SELECT {self.select_list(columns)}, rowid AS _rowid FROM products WHERE is_on_sale = 1",
+                    [],
+                    limit=limit, cursor=cursor, with_total=with_total
+                ),
+                tags=self._cache_tags(LISTING_TAG, columns)
+            )
+        except sqlite3.Error as e:
+            print(f"Error fetching on sale products: {e}")
+            return ResultPage()
+    
+    def search(self, query, limit=None, tags=None, cursor=None, with_total=False, columns=None):
+        """Search products with the FTS5 index, best BM25 matches first.
+
+        Every word must match, and each word also matches as a prefix so
+        partial words still find results. Words written as ``tag:gift``
+        (or passed in ``tags``) only match product tags.
+        """
+        match = self._build_match_query(query, tags)
+        if not match:
+            return ResultPage()
+        if not self.db.has_full_text_search():
+            return self._search_like(query, limit, cursor, with_total, columns)
         
-        if limit:
-            query += " LIMIT ?"
-            params.append(limit)
+        sql_query = self._search_query(columns)
         
         try:
-            cursor = self.db.execute_query(query, params)
-            products = cursor.fetchall()
-            cursor.close()
-            return [self._format_product(dict(p)) for p in products]
+            return self.db.cache.get_or_load(
+                ('search', match, limit, cursor, with_total, columns),
+                lambda: self._fetch_page(
+                    sql_query, [match], limit=limit, cursor=cursor,
+                    with_total=with_total, scored=True
+                ),
+                tags=self._cache_tags(LISTING_TAG, columns)
+            )
         except sqlite3.Error as e:
-            print(f"Error fetching on sale products: {e}")
-            return []
+            print(f"Error searching products: {e}")
+            return ResultPage()
+    
+    def stream_all(self, offset=None, cursor=None, columns=None):
+        """Every product in listing order, read lazily and never cached"""
+        return self._stream_page(
+            f"SELECT {self.select_list(columns)}, rowid AS _rowid FROM products", [],
+            offset=offset, cursor=cursor
+        )
+    
+    def stream_search(self, query, tags=None, cursor=None, columns=None):
+        """Every search match, best first, read lazily and never cached"""
+        match = self._build_match_query(query, tags)
+        if not match:
+            return iter(())
+        if not self.db.has_full_text_search():
+            sql_query, params = self._like_query(query, columns)
+            return self._stream_page(sql_query, params, cursor=cursor)
+        return self._stream_page(
+            self._search_query(columns), [match], cursor=cursor, scored=True
+        )
     
-    def search(self, query, limit=None):
-        """Search products by name or description"""
+    def count_all(self):
+        """Number of products, for streamed listings asked for a total"""
+        return self._count("SELECT id FROM products", [])
+    
+    def count_search(self, query, tags=None):
+        """Number of search matches, for streamed searches asked for a total"""
+        match = self._build_match_query(query, tags)
+        if not match:
+            return 0
+        if not self.db.has_full_text_search():
+            return self._count(*self._like_query(query, ('id',)))
+        return self._count(self._search_query(('id',)), [match])
+    
+    def _search_query(self, columns=None):
+        """FTS5 query selecting matches with their BM25 score"""
+        # Column weights: name, description, category, tags
+        return f"""
+            SELECT {self.select_list(columns, 'p.')}, p.rowid AS _rowid,
+                   bm25(products_fts, 10.0, 1.0, 4.0, 6.0) AS _score
+            FROM products_fts
+            JOIN products p ON p.rowid = products_fts.rowid
+            WHERE products_fts MATCH ?
+        """
+    
+    def _like_query(self, query, columns=None):
+        """Unindexed substring search query and its parameters"""
         search_term = f"%{query}%"
-        sql_query = """
-            SELECT * FROM products 
+        sql_query = f"""
+            SELECT {self.select_list(columns)}, rowid AS _rowid FROM products
             WHERE name LIKE ? OR description LIKE ? OR category LIKE ?
         """
-        params = [search_term, search_term, search_term]
+        return sql_query, [search_term, search_term, search_term]
+    
+    def _fetch_page(self, base_query, params, limit=None, offset=None, cursor=None,
+                    with_total=False, scored=False):
+        """Run a listing query with keyset pagination.
+
+        ``base_query`` must select ``_rowid`` (and ``_score`` when ``scored``).
+        Rows are ordered by those keys and the next page starts strictly after
+        the last row returned, so deep pages cost the same as the first one.
+        Raises ValueError for a malformed cursor or a limit below 1.
+        """
+        limit = page_limit(limit)
+        query, page_params, keys = self._page_query(
+            base_query, params, limit=limit, offset=offset, cursor=cursor, scored=scored
+        )
+        db_cursor = self.db.execute_query(query, page_params)
+        rows = db_cursor.fetchall()
+        db_cursor.close()
+        
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][key] for key in keys])
+        
+        products = [format_product(row, drop=keys) for row in rows]
+        
+        total = self._count(base_query, params) if with_total else None
+        return ResultPage(products, next_cursor, total)
+    
+    def _count(self, base_query, params):
+        """Number of rows a listing query matches, ignoring any cursor"""
+        db_cursor = self.db.execute_query(f"SELECT COUNT(*) FROM ({base_query})", params)
+        total = db_cursor.fetchone()[0]
+        db_cursor.close()
+        return total
+    
+    def _stream_page(self, base_query, params, offset=None, cursor=None, scored=False):
+        """Like _fetch_page without a limit, yielding products as they are read"""
+        query, page_params, keys = self._page_query(
+            base_query, params, offset=offset, cursor=cursor, scored=scored
+        )
+        rows = self.db.stream_query(query, page_params)
+        return (format_product(row, drop=keys) for row in rows)
+    
+    def _page_query(self, base_query, params, limit=None, offset=None, cursor=None, scored=False):
+        """Build the keyset-ordered listing query; returns (query, params, key columns)"""
+        keys = ['_score', '_rowid'] if scored else ['_rowid']
+        query = f"SELECT * FROM ({base_query})"
+        page_params = list(params)
+        
+        if cursor:
+            after = decode_cursor(cursor, len(keys))
+            if scored:
+                query += " WHERE _score > ? OR (_score = ? AND _rowid > ?)"
+                page_params.extend([after[0], after[0], after[1]])
+            else:
+                query += " WHERE _rowid > ?"
+                page_params.append(after[0])
+        
+        query += f" ORDER BY {', '.join(keys)}"
         
         if limit:
-            sql_query += " LIMIT ?"
-            params.append(limit)
+            # Fetch one extra row to learn whether another page exists
+            query += " LIMIT ?"
+            page_params.append(limit + 1)
+        elif offset:
+            query += " LIMIT -1"
+        
+        if offset:
+            query += " OFFSET ?"
+            page_params.append(offset)
+        
+        return query, page_params, keys
+    
+    def _build_match_query(self, query, tags=None):
+        """Turn free text into a safe FTS5 MATCH expression"""
+        terms = []
+        tag_terms = [t.lower() for t in (tags or [])]
+        
+        for word in (query or '').split():
+            if word.lower().startswith('tag:'):
+                tag_terms.append(word[4:].lower())
+                continue
+            # Quote each token so user input can never inject FTS5 syntax
+            terms.extend(f'"{token}"*' for token in re.findall(r'\w+', word))
+        
+        for tag in tag_terms:
+            tokens = re.findall(r'\w+', tag)
+            if tokens:
+                terms.append('tags : "' + ' '.join(tokens) + '"')
+        
+        return ' AND '.join(terms)
+    
+    def _search_like(self, query, limit=None, cursor=None, with_total=False, columns=None):
+        """Unindexed substring search used when FTS5 is not available"""
+        sql_query, params = self._like_query(query, columns)
         
         try:
-            cursor = self.db.execute_query(sql_query, params)
-            products = cursor.fetchall()
-            cursor.close()
-            return [self._format_product(dict(p)) for p in products]
+            return self._fetch_page(
+                sql_query, params, limit=limit, cursor=cursor, with_total=with_total
+            )
         except sqlite3.Error as e:
             print(f"Error searching products: {e}")
-            return []
+            return ResultPage()
     
     def update(self, product_id, product_data):
-        """Update product information"""
+        """Update product information; raises ValueError for an invalid deal_ends"""
+        self._check_deal_end(product_data)
         update_fields = []
         params = []
         
@@ -365,121 +1313,314 @@ class Product:
         query = f"UPDATE products SET {', '.join(update_fields)} WHERE id = ?"
         params.append(product_id)
         
-        self.db.cursor.execute(query, params)
+        # Listings of the old category go stale too when a product moves
+        categories = [self._get_category(product_id), product_data.get('category')]
+        
+        cursor = self.db.execute_query(query, params)
         self.db.conn.commit()
-        return self.db.cursor.rowcount > 0
+        self.invalidate(product_id, categories)
+        return cursor.rowcount > 0
     
-    def _format_product(self, product):
-        """Format product data before returning"""
-        # Convert JSON strings to lists
-        if product.get('sizes') and isinstance(product['sizes'], str):
-            try:
-                product['sizes'] = json.loads(product['sizes'])
-            except:
-                product['sizes'] = []
-        
-        if product.get('tags') and isinstance(product['tags'], str):
-            try:
-                product['tags'] = json.loads(product['tags'])
-            except:
-                product['tags'] = []
-        
-        # Convert integer boolean to Python boolean
-        product['is_on_sale'] = bool(product['is_on_sale'])
+    @staticmethod
+    def _cache_tags(tag, columns):
+        """Tags for a cached listing, adding STOCK_TAG when it shows stock_left"""
+        return [tag, STOCK_TAG] if shows_stock(columns) else [tag]
+    
+    @staticmethod
+    def _check_deal_end(product_data):
+        if product_data.get('deal_ends') is not None:
+            parse_deal_end(product_data['deal_ends'])
+    
+    def invalidate(self, product_id, categories=None):
+        """Drop cached copies of a product and every listing that may contain it"""
+        if categories is None:
+            categories = [self._get_category(product_id)]
         
-        return product
+        cache = self.db.cache
+        cache.invalidate(('product', product_id))
+        cache.invalidate_tag(LISTING_TAG)
+        for category in set(categories):
+            if category:
+                cache.invalidate_tag(f"category:{category}")
+    
+    def _get_category(self, product_id):
+        """Look up the current category of a product"""
+        cursor = self.db.execute_query("SELECT category FROM products WHERE id = ?", (product_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        return row['category'] if row else None
+
+
+# Columns returned by order listings that do not include items
+ORDER_SUMMARY_COLUMNS = "id, total_amount, status, created_at"
+
+
+class OutOfStock(Exception):
+    """Raised when an order asks for more units of a product than are left"""
+
+    def __init__(self, shortages):
+        super().__init__("Insufficient stock")
+        # [{'product_id', 'requested', 'available'}] for each line that cannot be filled
+        self.shortages = shortages
+
+
+def unit_price(product):
+    """Price a product sells for now: its deal price until deal_ends, then the original price"""
+    if product['is_on_sale'] and product['deal_ends'] and product['original_price']:
+        try:
+            if parse_deal_end(product['deal_ends']) < datetime.now(timezone.utc):
+                return product['original_price']
+        except ValueError:
+            # Rows written before deal_ends was validated
+            pass
+    return product['price']
 
 
 class Order:
     def __init__(self, db):
         self.db = db
     
-    def create(self, user_id, items, total_amount, shipping_address=None, payment_method=None):
-        """Create a new order with items"""
+    def create(self, user_id, items, shipping_address=None, payment_method=None):
+        """Reserve stock for a basket, create the order and return it.
+
+        Prices come from the products table, never from the client. Stock
+        checks, the conditional stock decrements, the header and the items
+        all run in one BEGIN IMMEDIATE transaction, so concurrent buyers
+        queue on the write lock and either every line is reserved or none
+        is. Raises ValueError for malformed items or unknown products and
+        OutOfStock when any line cannot be filled.
+        """
+        requested = self._requested_quantities(items)
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        conn = self.db.conn
         try:
-            self.db.cursor.execute(
+            conn.execute("BEGIN IMMEDIATE")
+            products = self._get_for_checkout(list(requested))
+            
+            unknown = [product_id for product_id in requested if product_id not in products]
+            if unknown:
+                raise ValueError(f"Unknown products: {', '.join(unknown)}")
+            
+            shortages = [
+                {'product_id': product_id, 'requested': quantity,
+                 'available': max(products[product_id]['stock_left'], 0)}
+                for product_id, quantity in requested.items()
+                if products[product_id]['stock_left'] is not None
+                and products[product_id]['stock_left'] < quantity
+            ]
+            if shortages:
+                raise OutOfStock(shortages)
+            
+            # NULL stock means the product is not stock-tracked
+            cursor = self.db.execute_many(
+                """UPDATE products SET stock_left = stock_left - ?
+                   WHERE id = ? AND (stock_left IS NULL OR stock_left >= ?)""",
+                [(quantity, product_id, quantity) for product_id, quantity in requested.items()]
+            )
+            if cursor.rowcount != len(requested):
+                raise OutOfStock([])
+            
+            order_items = []
+            total_amount = 0.0
+            for item in items:
+                price = unit_price(products[item['product_id']])
+                order_items.append((None, item['product_id'], item['quantity'], price, item.get('size')))
+                total_amount += price * item['quantity']
+            total_amount = round(total_amount, 2)
+            
+            cursor = self.db.execute_query(
                 """INSERT INTO orders 
-                   (user_id, total_amount, shipping_address, payment_method) 
-                   VALUES (?, ?, ?, ?)""",
-                (user_id, total_amount, shipping_address, payment_method)
+                   (user_id, total_amount, shipping_address, payment_method, created_at, updated_at) 
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (user_id, total_amount, shipping_address, payment_method, created_at, created_at)
             )
-            order_id = self.db.cursor.lastrowid
+            order_id = cursor.lastrowid
             
             # Add order items
-            for item in items:
-                self.db.cursor.execute(
-                    """INSERT INTO order_items 
-                       (order_id, product_id, quantity, price, size) 
-                       VALUES (?, ?, ?, ?, ?)""",
-                    (order_id, item['product_id'], item['quantity'], 
-                     item['price'], item.get('size'))
-                )
+            order_items = [(order_id,) + item[1:] for item in order_items]
+            self.db.execute_many(
+                """INSERT INTO order_items 
+                   (order_id, product_id, quantity, price, size) 
+                   VALUES (?, ?, ?, ?, ?)""",
+                order_items
+            )
             
-            self.db.conn.commit()
-            return order_id
+            conn.commit()
+        except (ValueError, OutOfStock):
+            conn.rollback()
+            raise
         except sqlite3.Error as e:
-            self.db.conn.rollback()
+            conn.rollback()
             print(f"Error creating order: {e}")
             return None
+        
+        # Stock changes bump only the stock version (migrations 6 and 7), so
+        # entries without stock_left, such as card listings, stay cached
+        self.db.cache.invalidate_tag(STOCK_TAG)
+        
+        return {
+            'id': order_id,
+            'user_id': user_id,
+            'total_amount': total_amount,
+            'status': 'pending',
+            'shipping_address': shipping_address,
+            'payment_method': payment_method,
+            'created_at': created_at,
+            'updated_at': created_at,
+            'items': [
+                {
+                    'product_id': product_id,
+                    'quantity': quantity,
+                    'price': price,
+                    'size': size,
+                    'name': products[product_id]['name'],
+                    'image': products[product_id]['image']
+                }
+                for _, product_id, quantity, price, size in order_items
+            ]
+        }
+    
+    def _requested_quantities(self, items):
+        """Validate basket items and total the quantity wanted per product"""
+        requested = {}
+        for item in items:
+            product_id = item.get('product_id') if isinstance(item, dict) else None
+            quantity = item.get('quantity') if isinstance(item, dict) else None
+            if (not isinstance(product_id, str) or not isinstance(quantity, int)
+                    or isinstance(quantity, bool) or quantity < 1):
+                raise ValueError("Each item needs a product_id and a positive integer quantity")
+            requested[product_id] = requested.get(product_id, 0) + quantity
+        return requested
+    
+    def _get_for_checkout(self, product_ids):
+        """Read the pricing, stock and display columns of the products in a basket"""
+        products = {}
+        for chunk in batched(product_ids):
+            cursor = self.db.execute_query(
+                f"""SELECT id, name, image, category, price, original_price, is_on_sale,
+                           deal_ends, stock_left
+                    FROM products WHERE id IN ({placeholders(len(chunk))})""",
+                chunk
+            )
+            products.update((row['id'], dict(row)) for row in cursor.fetchall())
+            cursor.close()
+        return products
     
     def get_by_id(self, order_id, user_id=None):
         """Get order by ID with optional user ID check"""
-        query = """
-            SELECT o.*, json_group_array(
-                json_object(
-                    'product_id', oi.product_id,
-                    'quantity', oi.quantity,
-                    'price', oi.price,
-                    'size', oi.size,
-                    'name', p.name,
-                    'image', p.image
-                )
-            ) as items
-            FROM orders o
-            JOIN order_items oi ON o.id = oi.order_id
-            LEFT JOIN products p ON oi.product_id = p.id
-            WHERE o.id = ?
+        orders = self.get_many([order_id], user_id)
+        return orders[0] if orders else None
+    
+    def get_many(self, order_ids, user_id=None):
+        """Get several orders with their items, in the order requested.
+
+        Headers and items are each read with one IN query per
+        IN_CHUNK_SIZE ids; ids that do not exist (or belong to another user
+        when user_id is given) are left out.
         """
-        params = [order_id]
+        unique_ids = list(dict.fromkeys(order_ids))
+        found = {}
+        for chunk in batched(unique_ids):
+            query = f"SELECT * FROM orders WHERE id IN ({placeholders(len(chunk))})"
+            params = list(chunk)
+            if user_id:
+                query += " AND user_id = ?"
+                params.append(user_id)
+            cursor = self.db.execute_query(query, params)
+            for row in cursor.fetchall():
+                found[row['id']] = dict(row)
+            cursor.close()
         
-        if user_id:
-            query += " AND o.user_id = ?"
-            params.append(user_id)
+        orders = [found[order_id] for order_id in unique_ids if order_id in found]
+        self._attach_items(orders)
+        return orders
+    
+    def get_user_orders(self, user_id, limit=None, cursor=None, include_items=False):
+        """Get a user's orders, newest first, with keyset pagination.
+
+        Without include_items only the order summary columns are returned;
+        with it, full orders and their items (two queries per page).
+        Raises ValueError for a malformed cursor or a limit below 1.
+        """
+        limit = page_limit(limit)
+        query, params = self._orders_query(user_id, include_items, cursor)
         
-        query += " GROUP BY o.id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit + 1)
         
-        self.db.cursor.execute(query, params)
-        order = self.db.cursor.fetchone()
+        db_cursor = self.db.execute_query(query, params)
+        rows = db_cursor.fetchall()
+        db_cursor.close()
         
-        if order:
-            order_dict = dict(order)
-            try:
-                order_dict['items'] = json.loads(order_dict['items'])
-            except:
-                order_dict['items'] = []
-            return order_dict
-        return None
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1]['created_at'], rows[-1]['id']])
+        
+        orders = [dict(row) for row in rows]
+        if include_items:
+            self._attach_items(orders)
+        return ResultPage(orders, next_cursor)
     
-    def get_user_orders(self, user_id):
-        """Get all orders for a user"""
-        self.db.cursor.execute(
-            """SELECT id, total_amount, status, created_at 
-               FROM orders WHERE user_id = ? 
-               ORDER BY created_at DESC""",
-            (user_id,)
-        )
-        orders = self.db.cursor.fetchall()
-        return [dict(order) for order in orders]
+    def stream_user_orders(self, user_id, include_items=False, cursor=None):
+        """All orders for a user (after cursor, if given), read lazily in batches"""
+        rows = self.db.stream_query(*self._orders_query(user_id, include_items, cursor))
+        if not include_items:
+            return (dict(order) for order in rows)
+        
+        def with_items():
+            for batch in batched(rows):
+                orders = [dict(order) for order in batch]
+                self._attach_items(orders)
+                yield from orders
+        return with_items()
+    
+    def _orders_query(self, user_id, include_items=False, cursor=None):
+        """Newest-first query for a user's orders after an optional cursor; returns (query, params)"""
+        columns = "*" if include_items else ORDER_SUMMARY_COLUMNS
+        query = f"SELECT {columns} FROM orders WHERE user_id = ?"
+        params = [user_id]
+        
+        if cursor:
+            created_at, order_id = decode_cursor(cursor, 2, kinds=(str, int))
+            query += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+            params.extend([created_at, created_at, order_id])
+        
+        return query + " ORDER BY created_at DESC, id DESC", params
+    
+    def _attach_items(self, orders):
+        """Load the items of many orders at once and set each order's items list"""
+        by_id = {}
+        for order in orders:
+            order['items'] = []
+            by_id[order['id']] = order
+        
+        for chunk in batched(list(by_id)):
+            cursor = self.db.execute_query(
+                f"""SELECT oi.order_id, oi.product_id, oi.quantity, oi.price, oi.size,
+                           p.name, p.image
+                    FROM order_items oi
+                    LEFT JOIN products p ON oi.product_id = p.id
+                    WHERE oi.order_id IN ({placeholders(len(chunk))})
+                    ORDER BY oi.order_id, oi.id""",
+                chunk
+            )
+            for row in cursor.fetchall():
+                item = dict(row)
+                by_id[item.pop('order_id')]['items'].append(item)
+            cursor.close()
+        return orders
     
     def update_status(self, order_id, status):
         """Update order status"""
-        self.db.cursor.execute(
+        cursor = self.db.execute_query(
             """UPDATE orders SET status = ?, updated_at = CURRENT_TIMESTAMP
                WHERE id = ?""",
             (status, order_id)
         )
         self.db.conn.commit()
-        return self.db.cursor.rowcount > 0
+        return cursor.rowcount > 0
 
 
 class Review:
@@ -487,27 +1628,44 @@ class Review:
         self.db = db
     
     def create(self, product_id, user_id, rating, comment=None):
-        """Create a product review"""
+        """Create a product review and update the product's rating aggregates.
+
+        The review insert and the aggregate update share one transaction, so
+        a review costs O(1) work and a single commit.
+        """
+        star = rating_bucket(rating)
         try:
-            self.db.cursor.execute(
+            cursor = self.db.execute_query(
                 """INSERT INTO reviews 
                    (product_id, user_id, rating, comment) 
                    VALUES (?, ?, ?, ?)""",
                 (product_id, user_id, rating, comment)
             )
-            self.db.conn.commit()
+            review_id = cursor.lastrowid
             
             # Update product rating
-            self._update_product_rating(product_id)
-            
-            return self.db.cursor.lastrowid
+            self.db.execute_query(
+                f"""UPDATE products
+                    SET rating_sum = rating_sum + ?,
+                        rating_count = rating_count + 1,
+                        rating_{star} = rating_{star} + 1,
+                        rating = (rating_sum + ?) / (rating_count + 1),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?""",
+                (rating, rating, product_id)
+            )
+            self.db.conn.commit()
         except sqlite3.Error as e:
+            self.db.conn.rollback()
             print(f"Error creating review: {e}")
             return None
+        
+        Product(self.db).invalidate(product_id)
+        return review_id
     
     def get_by_product(self, product_id):
         """Get all reviews for a product"""
-        self.db.cursor.execute(
+        cursor = self.db.execute_query(
             """SELECT r.*, u.name as user_name
                FROM reviews r
                JOIN users u ON r.user_id = u.id
@@ -515,27 +1673,49 @@ class Review:
                ORDER BY r.created_at DESC""",
             (product_id,)
         )
-        reviews = self.db.cursor.fetchall()
+        reviews = cursor.fetchall()
         return [dict(review) for review in reviews]
     
-    def _update_product_rating(self, product_id):
-        """Update product average rating"""
-        self.db.cursor.execute(
-            """SELECT AVG(rating) as avg_rating
-               FROM reviews
-               WHERE product_id = ?""",
-            (product_id,)
+    def recompute_ratings(self, product_id=None):
+        """Rebuild rating aggregates from the reviews table to repair drift.
+
+        Recomputes one product, or every product when ``product_id`` is None.
+        Returns the number of products updated.
+        """
+        where = "WHERE id = ?" if product_id else ""
+        params = [product_id] if product_id else []
+        buckets = ',\n'.join(
+            f"rating_{star} = (SELECT COUNT(*) FROM reviews r WHERE r.product_id = products.id"
+            f" AND CAST(r.rating + 0.5 AS INTEGER) = {star})"
+            for star in range(1, 6)
         )
-        result = self.db.cursor.fetchone()
-        
-        if result and result['avg_rating']:
-            self.db.cursor.execute(
-                """UPDATE products
-                   SET rating = ?, updated_at = CURRENT_TIMESTAMP
-                   WHERE id = ?""",
-                (result['avg_rating'], product_id)
+        try:
+            cursor = self.db.execute_query(
+                f"""UPDATE products SET
+                        rating_count = (SELECT COUNT(*) FROM reviews r WHERE r.product_id = products.id),
+                        rating_sum = (SELECT COALESCE(SUM(r.rating), 0) FROM reviews r
+                                      WHERE r.product_id = products.id),
+                        {buckets}
+                    {where}""",
+                params
+            )
+            updated = cursor.rowcount
+            self.db.execute_query(
+                f"""UPDATE products SET rating = rating_sum / rating_count
+                    WHERE rating_count > 0 {'AND id = ?' if product_id else ''}""",
+                params
             )
             self.db.conn.commit()
+        except sqlite3.Error as e:
+            self.db.conn.rollback()
+            print(f"Error recomputing ratings: {e}")
+            raise
+        
+        if product_id:
+            Product(self.db).invalidate(product_id)
+        else:
+            self.db.cache.clear()
+        return updated
 
 
 class Wishlist:
@@ -545,7 +1725,7 @@ class Wishlist:
     def add_item(self, user_id, product_id):
         """Add product to user's wishlist"""
         try:
-            self.db.cursor.execute(
+            self.db.execute_query(
                 """INSERT INTO wishlist_items 
                    (user_id, product_id)
                    VALUES (?, ?)""",
@@ -559,46 +1739,22 @@ class Wishlist:
     
     def remove_item(self, user_id, product_id):
         """Remove product from user's wishlist"""
-        self.db.cursor.execute(
+        cursor = self.db.execute_query(
                 """DELETE FROM wishlist_items
                    WHERE user_id = ? AND product_id = ?""",
                 (user_id, product_id)
             )
         self.db.conn.commit()
-        return self.db.cursor.rowcount > 0
+        return cursor.rowcount > 0
     
-    def get_user_wishlist(self, user_id):
-        """Get all products in user's wishlist"""
-        self.db.cursor.execute(
-            """SELECT p.*, w.created_at as added_at
+    def get_user_wishlist(self, user_id, columns=None):
+        """Get all products in user's wishlist, optionally limited to some columns"""
+        cursor = self.db.execute_query(
+            f"""SELECT {Product.select_list(columns, 'p.')}, w.created_at as added_at
                FROM wishlist_items w
                JOIN products p ON w.product_id = p.id
                WHERE w.user_id = ?
                ORDER BY w.created_at DESC""",
             (user_id,)
         )
-        products = self.db.cursor.fetchall()
-        
-        formatted_products = []
-        for product in products:
-            product_dict = dict(product)
-            
-            # Format lists
-            if product_dict.get('sizes') and isinstance(product_dict['sizes'], str):
-                try:
-                    product_dict['sizes'] = json.loads(product_dict['sizes'])
-                except:
-                    product_dict['sizes'] = []
-            
-            if product_dict.get('tags') and isinstance(product_dict['tags'], str):
-                try:
-                    product_dict['tags'] = json.loads(product_dict['tags'])
-                except:
-                    product_dict['tags'] = []
-            
-            # Convert integer boolean to Python boolean
-            product_dict['is_on_sale'] = bool(product_dict['is_on_sale'])
-            
-            formatted_products.append(product_dict)
-        
-        return formatted_products 
\ No newline at end of file
+        return [format_product(row) for row in cursor.fetchall()] 
\ No newline at end of file
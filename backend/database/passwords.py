@@ -0,0 +1,133 @@
+"""PBKDF2 password hashing run off the request thread with admission control"""
+import hashlib
+import hmac
+import multiprocessing
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+ALGORITHM = 'pbkdf2_sha256'
+
+# Hashes written before the format carried its parameters look like
+# "<salt>$<hex digest>" and always used 100,000 iterations
+LEGACY_ITERATIONS = 100000
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool is saturated and cannot accept more work"""
+
+
+def pbkdf2(password, salt, iterations):
+    """Compute a PBKDF2-SHA256 digest (top level so worker processes can run it)"""
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+
+
+def parse_hash(stored_hash):
+    """Split a stored hash into (algorithm, iterations, salt, digest)"""
+    parts = stored_hash.split('$')
+    if len(parts) == 2:
+        return ALGORITHM, LEGACY_ITERATIONS, parts[0], parts[1]
+    if len(parts) == 4:
+        return parts[0], int(parts[1]), parts[2], parts[3]
+    raise ValueError("Unrecognized password hash format")
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords in a bounded worker pool.
+
+    At most ``workers`` hashes run at once and ``queue_depth`` more may wait;
+    anything beyond that raises HasherBusy immediately instead of tying up
+    request threads. The caller still waits for its own hash, so admission
+    only sheds load when ``workers + queue_depth`` is below the number of
+    request threads; the default of no queue rejects as soon as every worker
+    is busy. With ``workers=0`` hashing runs inline (scripts, tests).
+
+    hashlib releases the GIL during PBKDF2, so the default thread executor
+    already hashes in parallel. The process executor uses spawned workers,
+    which re-import the entry script; only use it with an import-safe one.
+    """
+
+    def __init__(self, iterations=LEGACY_ITERATIONS, workers=0, queue_depth=0, executor='thread'):
+        self.iterations = iterations
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.executor = executor
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure the hasher from app config"""
+        self.shutdown()
+        self.iterations = app.config.get('PASSWORD_HASH_ITERATIONS', self.iterations)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue_depth = app.config.get('PASSWORD_HASH_QUEUE_DEPTH', self.queue_depth)
+        self.executor = app.config.get('PASSWORD_HASH_EXECUTOR', self.executor)
+
+    def hash(self, password):
+        """Hash a password with a fresh salt using the current parameters"""
+        salt = secrets.token_hex(8)
+        digest = self._run(password, salt, self.iterations)
+        return f"{ALGORITHM}${self.iterations}${salt}${digest}"
+
+    def verify(self, password, stored_hash):
+        """Verify a password against a stored hash of any supported format"""
+        try:
+            algorithm, iterations, salt, expected = parse_hash(stored_hash)
+        except ValueError:
+            return False
+        if algorithm != ALGORITHM:
+            return False
+        
+        digest = self._run(password, salt, iterations)
+        return hmac.compare_digest(digest, expected)
+
+    def needs_rehash(self, stored_hash):
+        """True if the hash was made with older parameters than the current ones"""
+        try:
+            algorithm, iterations, _, _ = parse_hash(stored_hash)
+        except ValueError:
+            return True
+        return algorithm != ALGORITHM or iterations != self.iterations or stored_hash.count('$') != 3
+
+    def shutdown(self):
+        """Stop the worker pool; it is recreated on next use"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, password, salt, iterations):
+        """Run one PBKDF2 computation, inline or in the pool"""
+        if not self.workers:
+            return pbkdf2(password, salt, iterations)
+        
+        pool, slots = self._get_pool()
+        if not slots.acquire(blocking=False):
+            raise HasherBusy("Too many concurrent password operations")
+        
+        try:
+            future = pool.submit(pbkdf2, password, salt, iterations)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.executor == 'process':
+                    # spawn avoids forking a process that is running request threads
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hasher')
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+            return self._pool, self._slots
+
+
+# Inline hasher used when a model is created without one (seed scripts, tools)
+default_hasher = PasswordHasher()
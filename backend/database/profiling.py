@@ -0,0 +1,97 @@
+"""Slow-query logging with automatic EXPLAIN QUERY PLAN capture."""
+import re
+import sqlite3
+import threading
+
+# "IN (?, ?, ?)" lists vary in length; collapse them so each statement is reported once
+PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+WHITESPACE = re.compile(r'\s+')
+# Plain column lists differ with every ?fields= combination; report them as one shape
+COLUMN_LIST = re.compile(r'\bSELECT (?:\w+\.)?\w+(?: ?, ?(?:\w+\.)?\w+)+', re.IGNORECASE)
+# Literals written into the SQL text itself (bound parameters never appear in it)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+def normalize_statement(query):
+    """Single-line statement text, identical for every call of the same query.
+    
+    Column lists collapse to "SELECT ...", so client-chosen projections share
+    one metric series and one slow-query plan entry.
+    """
+    statement = PLACEHOLDER_LIST.sub('?, ...', WHITESPACE.sub(' ', query).strip())
+    return COLUMN_LIST.sub('SELECT ...', statement)
+
+
+def redact(query):
+    """Normalized statement with inline string literals replaced by ?"""
+    return STRING_LITERAL.sub('?', normalize_statement(query))
+
+
+def is_full_scan(detail):
+    """True for plan steps that read a whole table or index"""
+    return (detail.startswith('SCAN ')
+            and 'VIRTUAL TABLE' not in detail
+            and detail != 'SCAN CONSTANT ROW')
+
+
+class SlowQueryLog:
+    """Database query hook that reports statements slower than a threshold.
+
+    The first time a statement is slow its EXPLAIN QUERY PLAN is logged too,
+    with full scans marked, so missing indexes show up from real traffic.
+    Parameter values are never logged. Durations cover executing the
+    statement up to its first row, not fetching the rest.
+    """
+
+    def __init__(self, db, threshold_ms=100, explain=True, log=print):
+        self.db = db
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self.log = log
+        self.plans = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, query, params, seconds):
+        if seconds < self.threshold:
+            return
+        statement = redact(query)
+        self.log(f"Slow query ({seconds * 1000:.1f} ms): {statement}")
+        if not self.explain:
+            return
+
+        with self._lock:
+            if statement in self.plans:
+                return
+            # Reserve the slot so concurrent requests do not explain it again
+            self.plans[statement] = None
+        plan = self.explain_plan(query, params)
+        with self._lock:
+            self.plans[statement] = plan
+        if plan:
+            self.log("Query plan:\n" + "\n".join(
+                f"  {'  ' * depth}{detail}{'  <-- full scan' if is_full_scan(detail) else ''}"
+                for depth, detail in plan
+            ))
+
+    def explain_plan(self, query, params):
+        """EXPLAIN QUERY PLAN rows as (depth, detail) pairs, or [] if unavailable"""
+        try:
+            rows = self.db.conn.execute(f"EXPLAIN QUERY PLAN {query}", params or ()).fetchall()
+        except (sqlite3.Error, ValueError) as e:
+            # e.g. executemany statements, whose parameters are not kept
+            print(f"Could not explain slow query: {e}")
+            return []
+
+        depths = {0: -1}
+        plan = []
+        for row in rows:
+            node_id, parent, detail = row[0], row[1], row[3]
+            depths[node_id] = depths.get(parent, -1) + 1
+            plan.append((depths[node_id], detail))
+        return plan
+
+    def full_scans(self):
+        """Statements seen so far whose plan includes a full scan"""
+        with self._lock:
+            return sorted(statement for statement, plan in self.plans.items()
+                          if plan and any(is_full_scan(detail) for _, detail in plan))
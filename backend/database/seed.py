@@ -311,9 +311,10 @@ def seed_database():
     all_products = clothing_products + electronics_products + home_decor_products + toys_products + kitchenware_products
     
     # Insert products into database
-    for product in all_products:
-        product_id = product_model.create(product)
-        print(f"Created product: {product['name']} with ID: {product_id}")
+    summary = product_model.bulk_upsert(all_products)
+    print(f"Created {summary['upserted']} products")
+    for error in summary['errors']:
+        print(f"Skipped product {error['index']}: {error['error']}")
     
     print("Database seeded successfully!")
     db.close()
@@ -0,0 +1,75 @@
+"""Gunicorn settings for running the API in production.
+
+    gunicorn -c gunicorn.conf.py
+
+Workers are forked from a master that has already imported the app. No
+SQLite connection crosses the fork: the master closes its pool before
+forking and each worker opens its own, then warms the catalog cache before
+it accepts requests. SIGTERM lets in-flight requests finish before
+stopping, and SIGHUP replaces every worker with a fresh, re-warmed one
+(code changes still need a full restart, since the app is preloaded).
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Pre-forked workers, each serving requests from a pool of threads. SQLite
+# allows one writer at a time, so extra processes mostly help reads.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+
+# First listing page size loaded into each worker's cache at startup (0 disables)
+warmup_page_size = int(os.environ.get('WARMUP_PAGE_SIZE', 24))
+
+
+def when_ready(server):
+    """Warn when password hashing could occupy every request thread"""
+    from app.extensions import password_hasher
+    slots = password_hasher.workers + password_hasher.queue_depth
+    if password_hasher.workers and slots >= threads:
+        server.log.warning(
+            f"PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_DEPTH ({slots}) is not below "
+            f"WEB_THREADS ({threads}); a login burst can stall every request thread"
+        )
+
+
+def pre_fork(server, worker):
+    """Close the master's connections so no SQLite handle is shared with a worker"""
+    from app.extensions import db
+    db.close()
+
+
+def post_fork(server, worker):
+    """Open this worker's own connection pool and warm its catalog cache"""
+    from app.extensions import db
+    from database.models import Product
+
+    if db.connect():
+        server.log.info(f"Worker {worker.pid} opened its database in {db.bootstrap_seconds * 1000:.1f} ms")
+    if warmup_page_size > 0:
+        pages = Product(db).warm_cache(limit=warmup_page_size)
+        server.log.info(f"Worker {worker.pid} warmed {pages} listing pages")
+    db.release()
+
+
+def worker_exit(server, worker):
+    """Release the worker's connections and hashing pool on shutdown"""
+    from app.extensions import db, password_hasher
+    password_hasher.shutdown()
+    db.close()